@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import time
+import random
+import asyncio
+import functools
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+from config import Config
+from service_for_moderation import model_manager
+from update_processor import update_processor
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Режимы работы при перегрузке
+MODE_NORMAL = 'normal'    # Оцениваются все сообщения
+MODE_SAMPLE = 'sample'    # Оценивается только доля сообщений
+MODE_SHED = 'shed'        # Только дешевые фильтры, модель не вызывается
+
+
+class AdaptiveBatchController:
+    """
+    Подбор размера пакета и задержки пакетирования по целевому p99 задержки.
+
+    Размер пакета - это размер одного прохода модели; он ограничивается так,
+    чтобы обработка пакета укладывалась в половину бюджета задержки. Задержка сбора пакета уменьшается, когда p99
+    превышает цель, и растет, когда запас большой. Режим перегрузки
+    выбирается по глубине очереди с гистерезисом.
+    """
+
+    def __init__(self, target_p99_ms: float = 500, min_batch_size: int = 1, max_batch_size: int = 32,
+                 max_delay_ms: float = 20, sample_threshold: int = 64, shed_threshold: int = 256,
+                 sample_rate: float = 0.25, window: int = 512):
+        self.target_p99_ms = target_p99_ms
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_delay_ms = max_delay_ms
+        self.sample_threshold = sample_threshold
+        self.shed_threshold = shed_threshold
+        self.sample_rate = sample_rate
+
+        self.batch_size = max_batch_size
+        self.delay_ms = max_delay_ms / 2
+        self.mode = MODE_NORMAL
+        self.ms_per_text = None  # Экспоненциальное среднее времени модели на один текст
+        self._latencies = deque(maxlen=window)
+
+    def p99_ms(self) -> Optional[float]:
+        if not self._latencies:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+    def observe_batch(self, batch_size: int, compute_ms: float, latencies_ms) -> None:
+        """Учет результатов обработанного пакета"""
+        self._latencies.extend(latencies_ms)
+        per_text = compute_ms / max(1, batch_size)
+        self.ms_per_text = per_text if self.ms_per_text is None else 0.8 * self.ms_per_text + 0.2 * per_text
+
+        # Пакет должен укладываться в половину бюджета задержки
+        fitting = int(self.target_p99_ms / 2 / max(self.ms_per_text, 0.001))
+        self.batch_size = max(self.min_batch_size, min(self.max_batch_size, fitting))
+
+        p99 = self.p99_ms()
+        if p99 is not None:
+            if p99 > self.target_p99_ms:
+                self.delay_ms = self.delay_ms / 2
+            elif p99 < self.target_p99_ms / 2:
+                self.delay_ms = min(self.max_delay_ms, self.delay_ms + 1)
+
+    def update_mode(self, queue_depth: int) -> str:
+        """Выбор режима по глубине очереди и ожидаемому времени ожидания"""
+        expected_wait_ms = queue_depth * (self.ms_per_text or 0)
+        if queue_depth >= self.shed_threshold:
+            mode = MODE_SHED
+        elif self.mode == MODE_SHED and queue_depth >= self.shed_threshold // 2:
+            mode = MODE_SHED
+        elif queue_depth >= self.sample_threshold or expected_wait_ms > self.target_p99_ms:
+            mode = MODE_SAMPLE
+        elif self.mode != MODE_NORMAL and queue_depth >= self.sample_threshold // 2:
+            mode = MODE_SAMPLE
+        else:
+            mode = MODE_NORMAL
+
+        if mode != self.mode:
+            logger.warning(f"Toxicity scoring mode: {self.mode} -> {mode} (queue depth {queue_depth})")
+            self.mode = mode
+        return mode
+
+
+class AdaptiveToxicityScorer:
+    """
+    Асинхронная очередь оценки токсичности с адаптивным пакетированием.
+
+    load возвращает (обновлений в обработчиках, обновлений в очередях чатов).
+    Ожидающие своей очереди обновления учитываются в глубине очереди при выборе
+    режима: иначе очередь одного загруженного чата не видна контроллеру.
+    """
+
+    def __init__(self, manager, controller: AdaptiveBatchController,
+                 load: Optional[Callable[[], Tuple[int, int]]] = None):
+        self.manager = manager
+        self.controller = controller
+        self.load = load
+        self._queue = deque()
+        self._has_items = None
+        self._worker = None
+        # Модель выполняется в отдельном потоке, чтобы не блокировать event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="toxicity")
+        self.scored = 0
+        self.skipped = 0
+
+    def _depth(self) -> int:
+        """Глубина очереди с учетом обновлений, ждущих своей очереди в чатах"""
+        waiting = self.load()[1] if self.load is not None else 0
+        return len(self._queue) + waiting
+
+    def _more_expected(self) -> bool:
+        """Есть ли обработчики, которые еще могут добавить тексты в текущий пакет"""
+        if self.load is None:
+            return True
+        running = self.load()[0]
+        return running > len(self._queue)
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._has_items = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def score(self, text: str) -> Optional[float]:
+        """
+        Вероятность токсичности текста
+
+        Returns:
+            Optional[float]: вероятность или None, если оценка пропущена из-за перегрузки
+        """
+        if not self.manager or self.manager.active is None:
+            return None
+        self._ensure_worker()
+
+        mode = self.controller.update_mode(self._depth())
+        if mode == MODE_SHED or (mode == MODE_SAMPLE and random.random() >= self.controller.sample_rate):
+            self.skipped += 1
+            return None
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((text, time.perf_counter(), future))
+        self._has_items.set()
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._queue:
+                self._has_items.clear()
+                await self._has_items.wait()
+
+            # Если очередь короче пакета и добор возможен, ждем его не дольше текущей задержки
+            controller = self.controller
+            if len(self._queue) < controller.batch_size and controller.delay_ms > 0 and self._more_expected():
+                await asyncio.sleep(controller.delay_ms / 1000)
+
+            batch = []
+            while self._queue and len(batch) < controller.batch_size:
+                batch.append(self._queue.popleft())
+
+            texts = [item[0] for item in batch]
+            started = time.perf_counter()
+            try:
+                # Пакет целиком уходит в один проход модели
+                _, probas = await loop.run_in_executor(
+                    self._executor, functools.partial(self.manager.predict, texts, batch_size=len(texts))
+                )
+            except Exception as e:
+                logger.error(f"Batch scoring error: {str(e)}")
+                probas = []
+            finished = time.perf_counter()
+
+            scored = len(probas) == len(batch)
+            for i, (_, enqueued, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result(float(probas[i]) if scored else None)
+            self.scored += len(batch)
+
+            controller.observe_batch(
+                len(batch),
+                (finished - started) * 1000,
+                [(finished - enqueued) * 1000 for _, enqueued, _ in batch]
+            )
+            controller.update_mode(self._depth())
+
+    async def run_in_inference_thread(self, fn):
+        """Выполняет вызов в потоке инференса (например, запуск torch-профайлера)"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn)
+
+    def metrics(self) -> dict:
+        """Текущее состояние для мониторинга"""
+        controller = self.controller
+        return {
+            'mode': controller.mode,
+            'queue_depth': len(self._queue),
+            'waiting_updates': self.load()[1] if self.load is not None else 0,
+            'batch_size': controller.batch_size,
+            'delay_ms': round(controller.delay_ms, 2),
+            'p99_ms': controller.p99_ms(),
+            'ms_per_text': controller.ms_per_text,
+            'scored': self.scored,
+            'skipped': self.skipped,
+        }
+
+
+toxicity_scorer = AdaptiveToxicityScorer(
+    model_manager,
+    AdaptiveBatchController(
+        target_p99_ms=getattr(Config, 'SCORING_TARGET_P99_MS', 500),
+        max_batch_size=getattr(Config, 'SCORING_MAX_BATCH_SIZE', 32),
+        max_delay_ms=getattr(Config, 'SCORING_MAX_DELAY_MS', 20),
+        sample_threshold=getattr(Config, 'SCORING_SAMPLE_QUEUE_DEPTH', 64),
+        shed_threshold=getattr(Config, 'SCORING_SHED_QUEUE_DEPTH', 256),
+        sample_rate=getattr(Config, 'SCORING_SAMPLE_RATE', 0.25)
+    ),
+    load=update_processor.load
+)
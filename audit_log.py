@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import sys
+import glob
+import json
+import time
+import atexit
+import logging
+import argparse
+import threading
+from collections import deque, Counter
+from datetime import datetime, timezone
+from typing import Optional
+from config import Config
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+FILE_PREFIX = "decisions-"
+FILE_PATTERN = re.compile(r'decisions-(\d{4}-\d{2}-\d{2})-(\d+)\.jsonl$')
+
+
+class DecisionLog:
+    """
+    Структурированный журнал решений модерации.
+
+    record() только добавляет запись в кольцевой буфер в памяти, запись на диск
+    выполняет фоновый поток пакетами в файлы decisions-<дата>-<номер>.jsonl
+    с ротацией по размеру. При переполнении буфера теряются самые старые записи.
+    """
+
+    def __init__(self, directory: str, buffer_size: int = 100000, batch_size: int = 500,
+                 flush_interval: float = 1.0, max_file_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_file_bytes = max_file_bytes
+        self.dropped = 0
+        self.written = 0
+
+        self._buffer = deque(maxlen=buffer_size)
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._file = None
+        self._file_date = None
+        self._file_seq = 0
+
+        self._thread = threading.Thread(target=self._writer, name="decision-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, chat_id: int, user_id: Optional[int], message_id: Optional[int],
+               stage: str, action: str, score: Optional[float] = None,
+               latency_ms: Optional[float] = None, **extra) -> None:
+        """Добавляет решение в буфер (без обращения к диску)"""
+        entry = {
+            'ts': time.time(),
+            'chat_id': chat_id,
+            'user_id': user_id,
+            'message_id': message_id,
+            'stage': stage,
+            'action': action,
+            'score': round(score, 4) if score is not None else None,
+            'latency_ms': round(latency_ms, 2) if latency_ms is not None else None,
+        }
+        if extra:
+            entry.update(extra)
+
+        buffer = self._buffer
+        if len(buffer) == buffer.maxlen:
+            self.dropped += 1
+        buffer.append(entry)
+        if len(buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _open_file(self, date: str):
+        """Открывает текущий сегмент за дату, при необходимости начиная новый"""
+        if self._file is not None and self._file_date == date and self._file.tell() < self.max_file_bytes:
+            return self._file
+
+        if self._file is not None:
+            self._file.close()
+
+        if self._file_date != date:
+            # Продолжаем нумерацию сегментов после перезапуска
+            os.makedirs(self.directory, exist_ok=True)
+            existing = [
+                int(match.group(2))
+                for match in map(FILE_PATTERN.search, glob.glob(os.path.join(self.directory, f"{FILE_PREFIX}{date}-*.jsonl")))
+                if match
+            ]
+            self._file_seq = max(existing, default=0)
+            self._file_date = date
+
+        path = os.path.join(self.directory, f"{FILE_PREFIX}{date}-{self._file_seq:03d}.jsonl")
+        if os.path.exists(path) and os.path.getsize(path) >= self.max_file_bytes:
+            self._file_seq += 1
+            path = os.path.join(self.directory, f"{FILE_PREFIX}{date}-{self._file_seq:03d}.jsonl")
+
+        self._file = open(path, 'a', encoding='utf-8')
+        return self._file
+
+    def flush(self) -> int:
+        """Записывает накопленные записи на диск, возвращает их количество"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        buffer = self._buffer
+        count = 0
+        lines_by_date = {}
+        while buffer:
+            try:
+                entry = buffer.popleft()
+            except IndexError:
+                break
+            date = datetime.fromtimestamp(entry['ts'], timezone.utc).strftime('%Y-%m-%d')
+            lines_by_date.setdefault(date, []).append(
+                json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+            )
+            count += 1
+
+        for date, lines in lines_by_date.items():
+            f = self._open_file(date)
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+        self.written += count
+        return count
+
+    def _writer(self) -> None:
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Decision log write error: {str(e)}")
+                time.sleep(self.flush_interval)
+
+    def close(self) -> None:
+        """Остановка фонового потока с записью остатка буфера"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Decision log write error: {str(e)}")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> dict:
+        return {'buffered': len(self._buffer), 'written': self.written, 'dropped': self.dropped}
+
+
+def query(directory: str, date: str, chat_id: Optional[int] = None, user_id: Optional[int] = None,
+          stage: Optional[str] = None, action: Optional[str] = None):
+    """Итерирует решения за дату с фильтрацией"""
+    # Быстрый отсев строк по подстроке до разбора JSON (формат записи фиксирован в flush)
+    needles = []
+    if chat_id is not None:
+        needles.append(f'"chat_id":{chat_id},')
+    if user_id is not None:
+        needles.append(f'"user_id":{user_id},')
+    if stage is not None:
+        needles.append(f'"stage":{json.dumps(stage, ensure_ascii=False)}')
+    if action is not None:
+        needles.append(f'"action":{json.dumps(action, ensure_ascii=False)}')
+
+    paths = sorted(glob.glob(os.path.join(directory, f"{FILE_PREFIX}{date}-*.jsonl")))
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if all(needle in line for needle in needles):
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main(argv=None) -> None:
+    """Инструмент просмотра журнала: python audit_log.py --date 2024-01-01 --summary"""
+    parser = argparse.ArgumentParser(description="Запросы к журналу решений модерации")
+    parser.add_argument('--dir', default=getattr(Config, 'AUDIT_LOG_DIR', 'app/audit'))
+    parser.add_argument('--date', default=datetime.now(timezone.utc).strftime('%Y-%m-%d'), help="Дата (UTC) в формате YYYY-MM-DD")
+    parser.add_argument('--chat', type=int)
+    parser.add_argument('--user', type=int)
+    parser.add_argument('--stage')
+    parser.add_argument('--action')
+    parser.add_argument('--summary', action='store_true', help="Сводка вместо списка записей")
+    args = parser.parse_args(argv)
+
+    records = query(args.dir, args.date, args.chat, args.user, args.stage, args.action)
+    if not args.summary:
+        for entry in records:
+            sys.stdout.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return
+
+    by_stage = Counter()
+    by_chat = Counter()
+    latencies = []
+    total = 0
+    for entry in records:
+        total += 1
+        by_stage[(entry['stage'], entry['action'])] += 1
+        by_chat[entry['chat_id']] += 1
+        if entry.get('latency_ms') is not None:
+            latencies.append(entry['latency_ms'])
+
+    print(f"Решений за {args.date}: {total}")
+    for (stage, action), count in by_stage.most_common():
+        print(f"  {stage:<16} {action:<8} {count}")
+    print("Самые активные чаты:")
+    for chat, count in by_chat.most_common(10):
+        print(f"  {chat}: {count}")
+    if latencies:
+        print(f"Задержка, мс: p50={_percentile(latencies, 0.5)} p99={_percentile(latencies, 0.99)} max={max(latencies)}")
+
+
+decision_log = DecisionLog(
+    directory=getattr(Config, 'AUDIT_LOG_DIR', 'app/audit'),
+    buffer_size=getattr(Config, 'AUDIT_BUFFER_SIZE', 100000),
+    batch_size=getattr(Config, 'AUDIT_BATCH_SIZE', 500),
+    flush_interval=getattr(Config, 'AUDIT_FLUSH_INTERVAL', 1.0),
+    max_file_bytes=getattr(Config, 'AUDIT_MAX_FILE_BYTES', 64 * 1024 * 1024)
+)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,30 @@
+import os
+import time
 import asyncio
-import re
 import logging
-from datetime import datetime, timedelta
 from telegram import Update, ChatPermissions
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
+    ChatMemberHandler,
+    TypeHandler,
     ContextTypes,
     filters
 )
 from config import Config
-from service_for_moderation import toxicity_classifier
+from service_for_moderation import model_manager
 from virustotal_scanner import vt_scanner
+from domain_reputation import domain_index, VERDICT_ALLOW, VERDICT_DENY
+from member_cache import member_cache, MemberInfo
+from user_state import user_states
+from message_analysis import analyze_message, normalize_text
+from audit_log import decision_log
+from adaptive_scoring import toxicity_scorer
+from raid_guard import raid_guard
+from enforcement import enforcement_queue
+from update_processor import update_processor
+from profiling import profiler, MAX_PROFILE_SECONDS
 
 # Настройка логирования
 logging.basicConfig(
@@ -28,13 +40,17 @@ SPAM_LIMIT = Config.SPAM_LIMIT
 DEFAULT_MUTE_DURATION = Config.MUTE_DURATION
 TIME_UPDATE_COUNT_MESSAGES = Config.TIME_UPDATE_COUNT_MESSAGES
 TOXICITY_THRESHOLD = Config.TOXICITY_THRESHOLD
+RAID_RESTRICT_DURATION = getattr(Config, 'RAID_RESTRICT_DURATION', 3600)
+BOT_OWNER_IDS = set(getattr(Config, 'BOT_OWNER_IDS', []))
+MODEL_DIR = os.path.abspath(getattr(Config, 'MODEL_DIR', os.path.dirname(Config.MODEL_PATH)))
 
 DEFAULT_CHAT_SETTINGS = Config.DEFAULT_CHAT_SETTINGS
 
+# Запрещенные слова приводятся к тому же виду, что и текст сообщений
+BANNED_WORDS_NORMALIZED = [normalize_text(word) for word in BANNED_WORDS]
+
 # Глобальные переменные для отслеживания активности
-user_warnings = {}           # Ключ: (chat_id, user_id)
-user_message_timestamps = {} # Ключ: (chat_id, user_id) -> [timestamp1, timestamp2, ...]
-user_mute_status = {}        # Ключ: (chat_id, user_id)
+# Предупреждения, муты и окна флуда пользователей хранятся в user_states
 chat_admins = {}             # {chat_id: [admin_id1, admin_id2]}
 chat_settings = {}           # {chat_id: settings_dict}
 
@@ -53,6 +69,49 @@ async def is_user_admin(chat_id: int, user_id: int, context: ContextTypes.DEFAUL
         chat_admins[chat_id] = await get_chat_admins(chat_id, context)
     return user_id in chat_admins[chat_id]
 
+def is_bot_owner(user_id: int) -> bool:
+    """Проверяем, является ли пользователь владельцем бота (глобальные команды)"""
+    return user_id in BOT_OWNER_IDS
+
+def log_decision(update: Update, stage: str, action: str, started: float = None,
+                 score: float = None, target_message=None, **extra) -> None:
+    """Запись решения модерации в журнал (без ожидания диска)"""
+    message = target_message or update.message
+    decision_log.record(
+        chat_id=update.effective_chat.id,
+        user_id=message.from_user.id if message.from_user else None,
+        message_id=message.message_id,
+        stage=stage,
+        action=action,
+        score=score,
+        latency_ms=(time.perf_counter() - started) * 1000 if started is not None else None,
+        **extra
+    )
+
+async def get_member_info(chat_id: int, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> MemberInfo:
+    """Статус участника чата из кеша (запрос к API только при промахе)"""
+    return await member_cache.get(chat_id, user_id, context.bot.get_chat_member)
+
+async def track_chat_members(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обновляет кеш участников по всем входящим обновлениям"""
+    try:
+        member_update = update.chat_member or update.my_chat_member
+        if member_update:
+            member_cache.observe_member(member_update.chat.id, member_update.new_chat_member)
+            return
+
+        message = update.message
+        if not message:
+            return
+        chat_id = message.chat_id
+        member_cache.observe_user(chat_id, message.from_user)
+        for new_member in message.new_chat_members or ():
+            member_cache.set(chat_id, new_member.id, 'member', new_member.username)
+        if message.left_chat_member:
+            member_cache.set(chat_id, message.left_chat_member.id, 'left', message.left_chat_member.username)
+    except Exception as e:
+        logger.error(f"Member cache update error: {str(e)}")
+
 async def get_chat_settings(chat_id: int) -> dict:
     """Получаем настройки для чата (создаем если нужно)"""
     if chat_id not in chat_settings:
@@ -84,6 +143,8 @@ async def ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         target_id = update.message.reply_to_message.from_user.id
         username = update.message.reply_to_message.from_user.username or "пользователь"
         await context.bot.ban_chat_member(chat_id=chat_id, user_id=target_id)
+        member_cache.set(chat_id, target_id, 'kicked', username)
+        log_decision(update, 'admin_command', 'ban', target_message=update.message.reply_to_message, moderator_id=user_id)
         await update.message.reply_text(f"✅ Пользователь @{username} забанен.")
     except Exception as e:
         logger.error(f"Ban error: {str(e)}")
@@ -95,16 +156,13 @@ async def unmute_user(chat_id: int, user_id: int, context: ContextTypes.DEFAULT_
     mute_duration = settings.get('mute_duration', DEFAULT_MUTE_DURATION)
     
     await asyncio.sleep(mute_duration)
-    mute_key = (chat_id, user_id)
     try:
-        if mute_key in user_mute_status and user_mute_status[mute_key]:
-            # Сбрасываем статус мута
-            user_mute_status[mute_key] = False
-            
+        # Сбрасываем статус мута
+        if user_states.unmute(chat_id, user_id):
             # Получаем текущее имя пользователя
             try:
-                member = await context.bot.get_chat_member(chat_id, user_id)
-                username = member.user.username or "пользователь"
+                member = await get_member_info(chat_id, user_id, context)
+                username = member.username or "пользователь"
                 await context.bot.send_message(chat_id, f"🔊 Пользователь @{username} размучен.")
             except:
                 logger.warning(f"Could not send unmute message for user {user_id}")
@@ -131,17 +189,16 @@ async def mute_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         target_id = update.message.reply_to_message.from_user.id
         username = update.message.reply_to_message.from_user.username or "пользователь"
         chat_type = update.effective_chat.type
-        mute_key = (chat_id, target_id)
         
         # Проверяем, не замьючен ли уже пользователь
-        if mute_key in user_mute_status and user_mute_status[mute_key]:
+        if user_states.is_muted(chat_id, target_id):
             await update.message.reply_text(f"ℹ️ Пользователь @{username} уже замьючен.")
             return
             
         # Проверяем, что пользователь все еще в чате
         try:
-            member = await context.bot.get_chat_member(chat_id, target_id)
-            if member.status in ['left', 'kicked']:
+            member = await get_member_info(chat_id, target_id, context)
+            if not member.is_present:
                 await update.message.reply_text(f"ℹ️ Пользователь @{username} вышел из чата.")
                 return
         except Exception as e:
@@ -154,6 +211,7 @@ async def mute_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             try:
                 permissions = ChatPermissions(can_send_messages=False)
                 await context.bot.restrict_chat_member(chat_id, target_id, permissions)
+                member_cache.set(chat_id, target_id, 'restricted', username)
             except Exception as e:
                 logger.error(f"Restrict error in supergroup: {str(e)}")
                 await update.message.reply_text(f"⚠️ Ошибка при муте: {str(e)}")
@@ -163,7 +221,9 @@ async def mute_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             pass
         
         # Устанавливаем статус мута для всех типов чатов
-        user_mute_status[mute_key] = True
+        user_states.mute(chat_id, target_id, mute_duration)
+        log_decision(update, 'admin_command', 'mute', target_message=update.message.reply_to_message,
+                     moderator_id=user_id, duration=mute_duration)
         await update.message.reply_text(f"🔇 Пользователь @{username} заглушен на {mute_duration} сек.")
         
         # Запускаем задачу для автоматического размута
@@ -198,39 +258,92 @@ async def warn_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
         target_id = update.message.reply_to_message.from_user.id
         username = update.message.reply_to_message.from_user.username or "пользователь"
-        warn_key = (chat_id, target_id)
-        
-        user_warnings[warn_key] = user_warnings.get(warn_key, 0) + 1
-        warnings_count = user_warnings[warn_key]
+        warnings_count = user_states.add_warning(chat_id, target_id)
+        log_decision(update, 'admin_command', 'warn', target_message=update.message.reply_to_message,
+                     moderator_id=user_id, warnings=warnings_count)
 
         if warnings_count >= 3:
             # При 3 предупреждениях - бан
             await context.bot.ban_chat_member(chat_id, target_id)
+            member_cache.set(chat_id, target_id, 'kicked', username)
+            log_decision(update, 'warnings', 'ban', target_message=update.message.reply_to_message, moderator_id=user_id)
             await update.message.reply_text(f"⛔ Пользователь @{username} забанен за 3 предупреждения.")
             # Сбрасываем счетчик предупреждений после бана
-            user_warnings[warn_key] = 0
+            user_states.reset_warnings(chat_id, target_id)
         else:
             await update.message.reply_text(f"⚠️ Предупреждение {warnings_count}/3 для @{username}")
     except Exception as e:
         logger.error(f"Warn error: {str(e)}")
         await update.message.reply_text(f"⚠️ Ошибка: {str(e)}")
 
+def restrict_raider(chat_id: int, user_id: int, context: ContextTypes.DEFAULT_TYPE, message_id: int = None) -> None:
+    """Ограничение новичка во время рейда через очередь исходящих действий"""
+    if user_id in chat_admins.get(chat_id, []):
+        return
+    enforcement_queue.restrict(context.bot, chat_id, user_id, RAID_RESTRICT_DURATION)
+    member_cache.set(chat_id, user_id, 'restricted')
+    decision_log.record(chat_id, user_id, message_id, 'raid', 'restrict')
+
+def start_raid_mode(chat_id: int, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Включение режима рейда: массовое ограничение недавно вступивших"""
+    joiners = raid_guard.recent_joiners(chat_id)
+    for joiner_id in joiners:
+        restrict_raider(chat_id, joiner_id, context)
+    enforcement_queue.send(
+        context.bot,
+        chat_id,
+        f"🛡️ Обнаружен рейд! Включен строгий режим на {int(raid_guard.raid_duration // 60)} мин.: "
+        f"новые участники ограничены, ссылки от обычных пользователей запрещены."
+    )
+    logger.warning(f"Raid mode enabled in chat {chat_id}, restricting {len(joiners)} recent joiners")
+
+async def handle_new_members(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Учет вступлений для обнаружения рейдов"""
+    try:
+        chat_id = update.effective_chat.id
+        joined = []
+        if update.chat_member:
+            old_status = update.chat_member.old_chat_member.status
+            new_status = update.chat_member.new_chat_member.status
+            if old_status in ('left', 'kicked') and new_status in ('member', 'restricted'):
+                joined.append(update.chat_member.new_chat_member.user)
+        elif update.message and update.message.new_chat_members:
+            joined.extend(update.message.new_chat_members)
+            # Во время рейда сервисные сообщения о вступлении тоже убираем
+            if raid_guard.is_raid(chat_id):
+                enforcement_queue.delete(context.bot, chat_id, update.message.message_id)
+
+        for user in joined:
+            if user.is_bot:
+                continue
+            started = raid_guard.record_join(chat_id, user.id)
+            if started is None:
+                # Повтор вступления (сервисное сообщение и chat_member) уже обработан
+                continue
+            if started:
+                start_raid_mode(chat_id, context)
+            elif raid_guard.is_raid(chat_id):
+                restrict_raider(chat_id, user.id, context)
+    except Exception as e:
+        logger.error(f"New member processing error: {str(e)}")
+
 async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Фильтр спама, токсичности, запрещённых слов и опасных ссылок"""
     if not update.message or not update.message.text:
         return
     
+    started = time.perf_counter()
     user_id = update.effective_user.id
     chat_id = update.effective_chat.id
     username = update.effective_user.username or "пользователь"
     chat_type = update.effective_chat.type
-    mute_key = (chat_id, user_id)
     
     # Получаем настройки чата
     settings = await get_chat_settings(chat_id)
     
     # Проверяем, не замьючен ли пользователь
-    if mute_key in user_mute_status and user_mute_status[mute_key]:
+    if user_states.is_muted(chat_id, user_id):
+        log_decision(update, 'muted', 'delete', started)
         try:
             await context.bot.delete_message(chat_id, update.message.message_id)
             logger.info(f"Deleted message from muted user {user_id} in chat {chat_id}")
@@ -241,11 +354,27 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     try:
         # Проверяем, является ли пользователь администратором
         is_admin = await is_user_admin(chat_id, user_id, context)
+
+        # Разбор сообщения выполняется один раз для всех проверок
+        analysis = analyze_message(update.message)
+
+        # 0. Режим рейда: строгая дешевая политика без BERT и VirusTotal
+        if raid_guard.record_message(chat_id, user_id):
+            start_raid_mode(chat_id, context)
+        raid = raid_guard.is_raid(chat_id)
+        if raid and not is_admin:
+            is_new_member = raid_guard.is_new_member(chat_id, user_id)
+            if is_new_member or analysis.urls or analysis.contains_any(BANNED_WORDS_NORMALIZED):
+                log_decision(update, 'raid', 'delete', started, content_hash=analysis.content_hash)
+                enforcement_queue.delete(context.bot, chat_id, update.message.message_id)
+                if is_new_member:
+                    restrict_raider(chat_id, user_id, context, update.message.message_id)
+                return
         
         # 1. Проверка на запрещённые слова (для всех)
         if settings['enable_banned_words_filter']:
-            text_lower = update.message.text.lower()
-            if any(banned_word in text_lower for banned_word in BANNED_WORDS):
+            if analysis.contains_any(BANNED_WORDS_NORMALIZED):
+                log_decision(update, 'banned_words', 'delete', started, content_hash=analysis.content_hash)
                 await context.bot.delete_message(chat_id, update.message.message_id)
                 await context.bot.send_message(
                     chat_id,
@@ -254,13 +383,13 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                 return
 
         # 2. Проверка на ссылки (только для обычных пользователей)
-        url_pattern = r'(?:https?://|www\.|\b)[a-zA-Z0-9-]+\.[a-zA-Z]{2,}(?:\.[a-zA-Z]{2,})*\S*'
-        url_matches = re.findall(url_pattern, update.message.text)
+        url_matches = analysis.urls
 
         if url_matches and not is_admin:
             # Если включен общий фильтр ссылок
             if settings['enable_link_filter']:
                 # Для обычных пользователей - сразу удаляем сообщение с любой ссылкой
+                log_decision(update, 'link_filter', 'delete', started, content_hash=analysis.content_hash)
                 await context.bot.delete_message(chat_id, update.message.message_id)
                 # Отправляем сообщение без указания ссылок
                 await context.bot.send_message(
@@ -269,9 +398,27 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                 )
                 return
             # Если ссылки разрешены, но включена проверка безопасности
-            elif settings['enable_virustotal'] and vt_scanner:
+            elif settings['enable_virustotal'] and (vt_scanner or domain_index) and not raid:
                 # Проверяем каждую ссылку, пока не найдем опасную
                 for url in url_matches:
+                    # Сначала локальный индекс репутации доменов
+                    if domain_index:
+                        verdict, host = domain_index.check_url(url)
+                        if verdict == VERDICT_ALLOW:
+                            continue
+                        if verdict == VERDICT_DENY:
+                            logger.info(f"Domain {host} is in denylist, deleting message in chat {chat_id}")
+                            log_decision(update, 'domain_denylist', 'delete', started,
+                                         content_hash=analysis.content_hash, domain=host)
+                            await context.bot.delete_message(chat_id, update.message.message_id)
+                            await context.bot.send_message(
+                                chat_id,
+                                f"🚫 Сообщение от @{username} удалено: обнаружены опасные ссылки."
+                            )
+                            return
+                    if not vt_scanner:
+                        continue
+
                     # Нормализация URL
                     normalized_url = url
                     if not url.startswith(('http://', 'https://')):
@@ -284,6 +431,8 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                     is_dangerous, detail = vt_scanner.get_url_reputation(normalized_url)
                     if is_dangerous:
                         # Нашли опасную ссылку - удаляем сообщение
+                        log_decision(update, 'virustotal', 'delete', started,
+                                     content_hash=analysis.content_hash, detail=detail)
                         await context.bot.delete_message(chat_id, update.message.message_id)
                         # Отправляем сообщение без указания ссылок
                         await context.bot.send_message(
@@ -294,27 +443,14 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                 
         # 3. Проверка на спам (исключая администраторов)
         if settings['enable_spam_filter']:
-            timestamp_key = (chat_id, user_id)
-            current_time = datetime.now()
-            
-            if timestamp_key not in user_message_timestamps:
-                user_message_timestamps[timestamp_key] = []
-            
-            # Удаляем старые сообщения
-            user_message_timestamps[timestamp_key] = [
-                ts for ts in user_message_timestamps[timestamp_key] 
-                if (current_time - ts).total_seconds() <= TIME_UPDATE_COUNT_MESSAGES
-            ]
-            
-            # Добавляем текущее сообщение
-            user_message_timestamps[timestamp_key].append(current_time)
-            message_count = len(user_message_timestamps[timestamp_key])
+            # Добавляем текущее сообщение, старые отбрасываются из окна
+            message_count = user_states.register_message(chat_id, user_id)
             
             logger.debug(f"User @{username} message count: {message_count} (last {TIME_UPDATE_COUNT_MESSAGES} sec)")
             
             # Проверяем превышение лимита (только для обычных пользователей)
             if (message_count > SPAM_LIMIT 
-                    and not (mute_key in user_mute_status and user_mute_status[mute_key])
+                    and not user_states.is_muted(chat_id, user_id)
                     and not is_admin):
                 try:
                     # Удаляем спам-сообщение
@@ -322,8 +458,8 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                     
                     # Проверяем, что пользователь все еще в чате
                     try:
-                        member = await context.bot.get_chat_member(chat_id, user_id)
-                        if member.status in ['left', 'kicked']:
+                        member = await get_member_info(chat_id, user_id, context)
+                        if not member.is_present:
                             logger.info(f"User @{username} has left the chat, skipping mute")
                             return
                     except Exception as e:
@@ -331,11 +467,12 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                         return
 
                     # Устанавливаем статус мута
-                    user_mute_status[mute_key] = True
-                    
-                    # Отправляем сообщение о муте
                     settings = await get_chat_settings(chat_id)
                     mute_duration = settings.get('mute_duration', DEFAULT_MUTE_DURATION)
+                    user_states.mute(chat_id, user_id, mute_duration)
+                    log_decision(update, 'spam', 'mute', started, messages=message_count, duration=mute_duration)
+                    
+                    # Отправляем сообщение о муте
                     await context.bot.send_message(
                         chat_id,
                         f"🔇 Флуд! @{username} получил мут на {mute_duration} сек. ({message_count} сообщений за последние {TIME_UPDATE_COUNT_MESSAGES} сек.)"
@@ -349,17 +486,19 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                 return
 
         # 4. Проверка на токсичность (для всех пользователей)
-        if settings['enable_toxicity_filter']:
+        if settings['enable_toxicity_filter'] and not raid:
             try:
-                if toxicity_classifier:
-                    is_toxic, prob = toxicity_classifier.predict_toxicity(update.message.text)
-                    if prob > TOXICITY_THRESHOLD:
-                        await context.bot.delete_message(chat_id, update.message.message_id)
-                        await context.bot.send_message(
-                            chat_id,
-                            f"🚫 Сообщение от @{username} удалено за токсичность (вероятность: {prob:.2f})."
-                        )
-                        return
+                # Оценка идет пакетами вне event loop; None - оценка пропущена при перегрузке
+                prob = await toxicity_scorer.score(analysis.text)
+                if prob is not None and prob > TOXICITY_THRESHOLD:
+                    log_decision(update, 'toxicity', 'delete', started, score=prob,
+                                 content_hash=analysis.content_hash)
+                    await context.bot.delete_message(chat_id, update.message.message_id)
+                    await context.bot.send_message(
+                        chat_id,
+                        f"🚫 Сообщение от @{username} удалено за токсичность (вероятность: {prob:.2f})."
+                    )
+                    return
             except Exception as e:
                 logger.error(f"Toxicity check error: {str(e)}")
 
@@ -382,6 +521,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "/disable <фильтр> - выключить фильтр\n"
         "/set_mute_duration <секунды> - установить длительность мута\n"
         "/set_links_policy <strict|safe|allow> - политика для ссылок\n"
+        "/raid [on|reset] - состояние защиты от рейдов\n"
         "\nДоступные фильтры: toxicity, spam, links, virustotal, banned_words, warnings"
         "\nПолитики для ссылок:"
         "\n- strict: все ссылки запрещены"
@@ -513,6 +653,195 @@ async def set_links_policy(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     else:
         await update.message.reply_text("❌ Неверная политика. Допустимые значения: strict, safe, allow")
 
+async def _load_model_in_background(chat_id: int, model_path: str, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Загрузка кандидата вне event loop с уведомлением о результате"""
+    loop = asyncio.get_running_loop()
+    success = await loop.run_in_executor(None, model_manager.load_candidate, model_path)
+    try:
+        if success:
+            await context.bot.send_message(
+                chat_id,
+                f"✅ Модель {os.path.basename(model_path)} загружена и прогрета. "
+                f"Теневая оценка: {model_manager.shadow_sample_rate:.0%} трафика. "
+                "/model_promote - сделать активной, /model_discard - отменить."
+            )
+        else:
+            await context.bot.send_message(chat_id, "⚠️ Не удалось загрузить модель, подробности в логах.")
+    except Exception as e:
+        logger.error(f"Model load notification error: {str(e)}")
+
+async def model_load(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Загрузить новый чекпоинт модели как кандидата"""
+    if not is_bot_owner(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+
+    if not model_manager:
+        await update.message.reply_text("⚠️ Сервис модерации не инициализирован.")
+        return
+
+    if not context.args:
+        await update.message.reply_text("ℹ️ Укажите файл модели. Например: /model_load full_model_v2.pth [доля_теневого_трафика]")
+        return
+
+    # Разрешаем загрузку только из каталога моделей: чекпоинт - это pickle
+    model_path = os.path.abspath(os.path.join(MODEL_DIR, context.args[0]))
+    if os.path.dirname(model_path) != MODEL_DIR or not os.path.isfile(model_path):
+        await update.message.reply_text("❌ Файл модели не найден в каталоге моделей.")
+        return
+
+    if len(context.args) > 1:
+        try:
+            model_manager.shadow_sample_rate = min(1.0, max(0.0, float(context.args[1])))
+        except ValueError:
+            await update.message.reply_text("❌ Доля теневого трафика должна быть числом от 0 до 1.")
+            return
+
+    asyncio.create_task(_load_model_in_background(update.effective_chat.id, model_path, context))
+    await update.message.reply_text("⏳ Загрузка модели запущена, бот продолжает работу на текущей модели.")
+
+async def model_promote(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Сделать загруженного кандидата активной моделью"""
+    if not is_bot_owner(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+
+    if model_manager and model_manager.promote():
+        await update.message.reply_text(f"✅ Активная модель: {os.path.basename(model_manager.active_path)}")
+    else:
+        await update.message.reply_text("ℹ️ Нет загруженной модели-кандидата.")
+
+async def model_discard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Отказаться от модели-кандидата"""
+    if not is_bot_owner(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+
+    if model_manager and model_manager.discard_candidate():
+        await update.message.reply_text("✅ Модель-кандидат выгружена.")
+    else:
+        await update.message.reply_text("ℹ️ Нет загруженной модели-кандидата.")
+
+async def model_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показать состояние моделей и результаты теневой оценки"""
+    if not is_bot_owner(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+
+    if not model_manager:
+        await update.message.reply_text("⚠️ Сервис модерации не инициализирован.")
+        return
+
+    status = model_manager.status()
+
+    def fmt(value, pattern):
+        return pattern.format(value) if value is not None else "—"
+
+    message = (
+        "🧠 Состояние моделей:\n"
+        f"• Активная: {os.path.basename(status['active_path']) if status['active_path'] else 'не загружена'}\n"
+        f"• Кандидат: {os.path.basename(status['candidate_path']) if status['candidate_path'] else 'нет'}"
+        f"{' (загружается)' if status['loading'] else ''}\n"
+        f"• Доля теневого трафика: {status['shadow_sample_rate']:.0%}\n"
+        f"• Теневых оценок: {status['shadow_samples']} (пропущено {status['shadow_dropped']})\n"
+        f"• Согласованность: {fmt(status['agreement'], '{:.1%}')}\n"
+        f"• Средняя разница вероятностей: {fmt(status['mean_proba_diff'], '{:.3f}')}\n"
+        f"• Задержка активной: {fmt(status['active_ms_per_text'], '{:.1f}')} мс/текст\n"
+        f"• Задержка кандидата: {fmt(status['candidate_ms_per_text'], '{:.1f}')} мс/текст"
+    )
+    await update.message.reply_text(message)
+
+async def raid_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показать или изменить состояние режима рейда"""
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+
+    if not await is_user_admin(chat_id, user_id, context):
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+
+    action = context.args[0].lower() if context.args else None
+    if action == 'reset':
+        raid_guard.reset(chat_id)
+        await update.message.reply_text("✅ Режим рейда выключен, счетчики сброшены.")
+        return
+    if action == 'on':
+        minutes = context.args[1] if len(context.args) > 1 else None
+        if minutes is not None and not minutes.isdigit():
+            await update.message.reply_text("ℹ️ Укажите длительность в минутах. Например: /raid on 30")
+            return
+        raid_guard.activate(chat_id, int(minutes) * 60 if minutes else None)
+        await update.message.reply_text("🛡️ Режим рейда включен вручную.")
+        return
+    if action is not None:
+        await update.message.reply_text("❌ Неверная команда. Использование: /raid [on [минуты]|reset]")
+        return
+
+    status = raid_guard.status(chat_id)
+    message = (
+        "🛡️ Защита от рейдов:\n"
+        f"• Режим рейда: {'🔥 включен, осталось ' + str(status['remaining']) + ' сек' if status['active'] else '✅ выключен'}\n"
+        f"• Вступлений за {int(raid_guard.window)} сек: {status['joins']} (порог {raid_guard.join_threshold})\n"
+        f"• Первых сообщений новичков: {status['first_messages']} (порог {raid_guard.first_message_threshold})\n"
+        f"• Новичков под наблюдением: {status['new_members']}\n"
+        f"• Рейдов обнаружено: {status['raids']}"
+    )
+    await update.message.reply_text(message)
+
+async def scoring_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показать состояние очереди оценки токсичности"""
+    if not is_bot_owner(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+
+    metrics = toxicity_scorer.metrics()
+    modes = {
+        'normal': "✅ оцениваются все сообщения",
+        'sample': "⚠️ оценивается только часть сообщений",
+        'shed': "🔥 только дешевые фильтры",
+    }
+    p99 = f"{metrics['p99_ms']:.0f} мс" if metrics['p99_ms'] is not None else "—"
+    message = (
+        "📈 Оценка токсичности:\n"
+        f"• Режим: {modes.get(metrics['mode'], metrics['mode'])}\n"
+        f"• Очередь: {metrics['queue_depth']}, ожидают в чатах: {metrics['waiting_updates']}\n"
+        f"• Размер пакета: {metrics['batch_size']}, задержка пакетирования: {metrics['delay_ms']} мс\n"
+        f"• p99 задержки: {p99} (цель {toxicity_scorer.controller.target_p99_ms:.0f} мс)\n"
+        f"• Оценено: {metrics['scored']}, пропущено: {metrics['skipped']}"
+    )
+    await update.message.reply_text(message)
+
+async def _profile_in_background(chat_id: int, session: asyncio.Task, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Ожидание сессии профилирования с уведомлением о результате"""
+    try:
+        report_dir = await session
+        if report_dir is None:
+            await context.bot.send_message(chat_id, "⚠️ Профилирование не выполнено: отчеты не созданы.")
+            return
+        await context.bot.send_message(chat_id, f"✅ Профилирование завершено. Отчеты: {report_dir}")
+    except Exception as e:
+        logger.error(f"Profiling error: {str(e)}")
+        await context.bot.send_message(chat_id, f"⚠️ Ошибка профилирования: {str(e)}")
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Запустить профилирование обработчиков и инференса на заданное время"""
+    if not is_bot_owner(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text(f"ℹ️ Укажите длительность в секундах (до {MAX_PROFILE_SECONDS}). Например: /profile 30")
+        return
+
+    duration = min(int(context.args[0]), MAX_PROFILE_SECONDS)
+    session = profiler.start(duration, toxicity_scorer.run_in_inference_thread)
+    if session is None:
+        await update.message.reply_text("ℹ️ Профилирование уже выполняется.")
+        return
+
+    asyncio.create_task(_profile_in_background(update.effective_chat.id, session, context))
+    await update.message.reply_text(f"⏱️ Профилирование запущено на {duration} сек.")
+
 async def enable_setting(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Включить настройку"""
     await toggle_setting(update, context, True)
@@ -522,25 +851,35 @@ async def disable_setting(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await toggle_setting(update, context, False)
 
 async def cleanup_old_messages(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Периодическая очистка старых записей о сообщениях"""
-    current_time = datetime.now()
-    keys_to_delete = []
-    
-    for key, timestamps in user_message_timestamps.items():
-        updated_timestamps = [
-            ts for ts in timestamps 
-            if (current_time - ts).total_seconds() <= TIME_UPDATE_COUNT_MESSAGES
-        ]
-        
-        if updated_timestamps:
-            user_message_timestamps[key] = updated_timestamps
-        else:
-            keys_to_delete.append(key)
-    
-    for key in keys_to_delete:
-        del user_message_timestamps[key]
-    
-    logger.info(f"Очистка старых сообщений: удалено {len(keys_to_delete)} записей")
+    """Периодическая очистка неактивных состояний пользователей и кешей"""
+    removed = user_states.cleanup()
+    usage = user_states.memory_usage()
+    logger.info(
+        f"Очистка состояний пользователей: удалено {removed} записей, "
+        f"осталось {usage['entries']} (~{usage['bytes_per_entry']} байт на запись, "
+        f"~{usage['bytes'] // 1024} КиБ)"
+    )
+
+    expired_members = member_cache.cleanup()
+    logger.info(
+        f"Кеш участников: {len(member_cache)} записей, удалено просроченных {expired_members}, "
+        f"попаданий {member_cache.hits}, промахов {member_cache.misses}"
+    )
+
+    raid_guard.cleanup()
+
+    audit = decision_log.stats()
+    if audit['dropped']:
+        logger.warning(f"Журнал решений: потеряно {audit['dropped']} записей из-за переполнения буфера")
+
+async def refresh_domain_lists(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Периодическая перезагрузка списков доменов при изменении файлов"""
+    try:
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, domain_index.reload):
+            logger.info(f"Списки доменов обновлены: {domain_index.stats()}")
+    except Exception as e:
+        logger.error(f"Ошибка обновления списков доменов: {str(e)}")
 
 async def refresh_admins(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Периодическое обновление списка администраторов"""
@@ -556,7 +895,12 @@ def main() -> None:
     logger.info("🤖 Бот запускается...")
     
     try:
-        app = Application.builder().token(TOKEN).build()
+        # Чаты обрабатываются параллельно, чтобы их сообщения попадали в общий пакет оценки;
+        # обновления одного чата по-прежнему идут строго по очереди
+        app = Application.builder().token(TOKEN).concurrent_updates(update_processor).build()
+
+        # Кеш статусов участников обновляется до остальных обработчиков (включая ChatMemberUpdated)
+        app.add_handler(TypeHandler(Update, track_chat_members), group=-1)
 
         # Регистрация обработчиков команд
         app.add_handler(CommandHandler("start", start))
@@ -568,7 +912,18 @@ def main() -> None:
         app.add_handler(CommandHandler("disable", disable_setting))
         app.add_handler(CommandHandler("set_mute_duration", set_mute_duration))
         app.add_handler(CommandHandler("set_links_policy", set_links_policy))
+        app.add_handler(CommandHandler("raid", raid_command))
+        app.add_handler(CommandHandler("model_load", model_load))
+        app.add_handler(CommandHandler("model_promote", model_promote))
+        app.add_handler(CommandHandler("model_discard", model_discard))
+        app.add_handler(CommandHandler("model_status", model_status))
+        app.add_handler(CommandHandler("scoring_status", scoring_status))
+        app.add_handler(CommandHandler("profile", profile_command))
         
+        # Вступления участников (для обнаружения рейдов)
+        app.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, handle_new_members))
+        app.add_handler(ChatMemberHandler(handle_new_members, ChatMemberHandler.CHAT_MEMBER))
+
         # Обработчик текстовых сообщений
         app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, check_message))
         
@@ -585,9 +940,16 @@ def main() -> None:
                 interval=600,
                 first=0
             )
+            if domain_index:
+                job_queue.run_repeating(
+                    refresh_domain_lists,
+                    interval=Config.DOMAIN_LISTS_REFRESH_INTERVAL,
+                    first=Config.DOMAIN_LISTS_REFRESH_INTERVAL
+                )
 
         logger.info("🔄 Бот запущен и ожидает сообщений...")
-        app.run_polling()
+        # chat_member обновления приходят только при явном запросе
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
     except Exception as e:
         logger.error(f"🚨 Ошибка при запуске бота: {str(e)}")
 
@@ -1,8 +1,10 @@
 ﻿# -*- coding: utf-8 -*-
 class Config:
     MODEL_PATH = "app/model/full_model.pth"
+    MODEL_DIR = "app/model"  # Каталог, из которого разрешена загрузка чекпоинтов командой /model_load
     TOKEN = "указать токен"
     VIRUSTOTAL_API_KEY = "указать ключ"
+    BOT_OWNER_IDS = []  # Telegram ID владельцев бота (глобальные команды: модели, профилирование)
     
     # Дополнительные параметры модерации
     BANNED_WORDS = ["мат1", "мат2", "оскорбление"]  # Запрещенные слова
@@ -10,6 +12,58 @@ class Config:
     MUTE_DURATION = 30  # Длительность мута в секундах
     TIME_UPDATE_COUNT_MESSAGES = 60  # Период сброса счетчика спама в секундах
     TOXICITY_THRESHOLD = 0.6  # Порог для удаления токсичных сообщений
+
+    # Локальный индекс репутации доменов (проверяется до VirusTotal)
+    DOMAIN_ALLOWLIST_PATH = "app/domains/allowlist.txt"  # Доверенные домены, по одному в строке
+    DOMAIN_DENYLIST_PATHS = ["app/domains/denylist.txt"]  # Блоклисты (поддерживается формат hosts)
+    PUBLIC_SUFFIX_LIST_PATH = "app/domains/public_suffix_list.dat"  # Необязательный полный PSL
+    DEFAULT_ALLOWED_DOMAINS = [
+        "t.me", "telegram.org", "youtube.com", "youtu.be", "google.com",
+        "wikipedia.org", "github.com", "vk.com", "yandex.ru", "ya.ru"
+    ]
+    DOMAIN_FINGERPRINT_THRESHOLD = 100000  # С какого размера блоклист хранится 64-битными отпечатками
+    DOMAIN_LISTS_REFRESH_INTERVAL = 300  # Период проверки обновления списков в секундах
+
+    # Кеш статусов участников чатов
+    MEMBER_CACHE_TTL = 600  # Время жизни записи в секундах
+    MEMBER_CACHE_MAX_SIZE = 100000  # Максимальное количество записей
+
+    # Состояния пользователей (предупреждения, муты, окна флуда)
+    USER_STATE_IDLE_TTL = 7 * 86400  # Через сколько секунд неактивности запись удаляется
+    USER_STATE_MAX_ENTRIES = 1000000  # Максимум записей на узел, при превышении вытесняются давние
+
+    # Горячая замена модели и теневая оценка
+    SHADOW_SAMPLE_RATE = 0.1  # Доля сообщений, оцениваемых и кандидатом (пока он загружен)
+    SHADOW_BATCH_SIZE = 16  # Размер пакета теневой оценки
+    SHADOW_QUEUE_SIZE = 1000  # Очередь теневой оценки, при переполнении сообщения пропускаются
+
+    # Журнал решений модерации
+    AUDIT_LOG_DIR = "app/audit"  # Каталог файлов decisions-<дата>-<номер>.jsonl
+    AUDIT_BUFFER_SIZE = 100000  # Размер кольцевого буфера в памяти
+    AUDIT_BATCH_SIZE = 500  # Сколько записей накопить до внеочередной записи на диск
+    AUDIT_FLUSH_INTERVAL = 1.0  # Период записи на диск в секундах
+    AUDIT_MAX_FILE_BYTES = 64 * 1024 * 1024  # Размер файла для ротации
+
+    # Адаптивное пакетирование оценки токсичности
+    CONCURRENT_UPDATES = 256  # Сколько обновлений принимается в обработку одновременно (включая ждущие очереди своего чата)
+    SCORING_TARGET_P99_MS = 500  # Целевой p99 задержки оценки в миллисекундах
+    SCORING_MAX_BATCH_SIZE = 32  # Максимальный размер пакета (один проход модели)
+    SCORING_MAX_DELAY_MS = 20  # Максимальное ожидание добора пакета
+    SCORING_SAMPLE_QUEUE_DEPTH = 64  # Глубина очереди, с которой оценивается только доля сообщений
+    SCORING_SHED_QUEUE_DEPTH = 256  # Глубина очереди, с которой работают только дешевые фильтры
+    SCORING_SAMPLE_RATE = 0.25  # Доля оцениваемых сообщений в режиме выборки
+
+    # Защита от рейдов
+    RAID_JOIN_THRESHOLD = 10  # Вступлений за окно для включения режима рейда
+    RAID_FIRST_MESSAGE_THRESHOLD = 10  # Первых сообщений новичков за окно для включения режима рейда
+    RAID_WINDOW = 60  # Окно обнаружения в секундах
+    RAID_DURATION = 600  # Длительность режима рейда в секундах (продлевается, пока рейд идет)
+    RAID_NEW_MEMBER_WINDOW = 600  # Сколько секунд после вступления пользователь считается новичком
+    RAID_RESTRICT_DURATION = 3600  # На сколько секунд ограничиваются новички во время рейда
+    ENFORCEMENT_RATE_PER_SECOND = 20  # Лимит вызовов API для массовых действий
+
+    # Профилирование по команде /profile
+    PROFILE_DIR = "app/profiles"  # Каталог отчетов (handlers.prof, stacks.folded, torch_ops.txt)
     DEFAULT_CHAT_SETTINGS = {
     'enable_toxicity_filter': True,
     'enable_spam_filter': True,
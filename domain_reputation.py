@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+import os
+import hashlib
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from urllib.parse import urlsplit
+from typing import Iterable, List, Optional, Set, Tuple
+from config import Config
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Вердикты индекса репутации
+VERDICT_ALLOW = 'allow'
+VERDICT_DENY = 'deny'
+VERDICT_UNKNOWN = 'unknown'
+
+# Минимальный набор составных публичных суффиксов на случай,
+# если полный Public Suffix List не загружен
+DEFAULT_PUBLIC_SUFFIXES = {
+    'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'me.uk',
+    'com.ru', 'net.ru', 'org.ru', 'pp.ru', 'msk.ru', 'spb.ru',
+    'com.ua', 'org.ua', 'net.ua', 'kiev.ua',
+    'com.kz', 'org.kz',
+    'com.by', 'net.by',
+    'com.au', 'net.au', 'org.au',
+    'co.jp', 'ne.jp', 'or.jp',
+    'com.br', 'net.br',
+    'com.cn', 'net.cn', 'org.cn',
+    'com.tr', 'co.in', 'co.il', 'co.kr', 'co.nz', 'co.za',
+    'github.io', 'gitlab.io', 'blogspot.com', 'herokuapp.com',
+    'appspot.com', 'pages.dev', 'workers.dev', 'vercel.app', 'netlify.app',
+}
+
+
+def _fingerprint(item: str) -> int:
+    """64-битный отпечаток домена"""
+    return int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class FingerprintSet:
+    """
+    Компактное множество для больших блоклистов: отсортированный массив
+    64-битных отпечатков blake2b (8 байт на домен), поиск бинарный.
+    Вероятность случайного совпадения - порядка n / 2**64, т.е. набор практически точный
+    """
+
+    def __init__(self, items: Iterable[str]):
+        self.fingerprints = array('Q', sorted(set(_fingerprint(item) for item in items)))
+
+    def __contains__(self, item: str) -> bool:
+        fingerprints = self.fingerprints
+        fingerprint = _fingerprint(item)
+        i = bisect_left(fingerprints, fingerprint)
+        return i < len(fingerprints) and fingerprints[i] == fingerprint
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.fingerprints) * self.fingerprints.itemsize
+
+
+class PublicSuffixList:
+    """Определение регистрируемого домена (eTLD+1)"""
+
+    def __init__(self, rules: Optional[Iterable[str]] = None):
+        self.rules = set()
+        self.wildcards = set()
+        self.exceptions = set()
+        for rule in (rules if rules is not None else DEFAULT_PUBLIC_SUFFIXES):
+            self._add_rule(rule)
+
+    def _add_rule(self, rule: str) -> None:
+        rule = rule.strip().lower()
+        if not rule or rule.startswith('//'):
+            return
+        try:
+            rule = rule.encode('idna').decode('ascii')
+        except UnicodeError:
+            pass
+        if rule.startswith('!'):
+            self.exceptions.add(rule[1:])
+        elif rule.startswith('*.'):
+            self.wildcards.add(rule[2:])
+        else:
+            self.rules.add(rule)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'PublicSuffixList':
+        """Загрузка списка в формате public_suffix_list.dat"""
+        with open(path, encoding='utf-8') as f:
+            rules = [line.split()[0] for line in f if line.strip() and not line.startswith('//')]
+        psl = cls(DEFAULT_PUBLIC_SUFFIXES)
+        for rule in rules:
+            psl._add_rule(rule)
+        return psl
+
+    def registrable_domain(self, host: str) -> str:
+        """Возвращает eTLD+1 для хоста (например, a.b.example.co.uk -> example.co.uk)"""
+        labels = host.split('.')
+        if len(labels) < 2:
+            return host
+
+        # Ищем самый длинный подходящий суффикс
+        suffix_len = 1
+        for i in range(len(labels) - 1):
+            candidate = '.'.join(labels[i:])
+            if candidate in self.exceptions:
+                suffix_len = len(labels) - i - 1
+                break
+            if candidate in self.rules:
+                suffix_len = len(labels) - i
+                break
+            if i + 1 < len(labels) and '.'.join(labels[i + 1:]) in self.wildcards:
+                suffix_len = len(labels) - i
+                break
+
+        if suffix_len >= len(labels):
+            return host
+        return '.'.join(labels[-(suffix_len + 1):])
+
+
+def extract_host(url: str) -> Optional[str]:
+    """Извлекает нормализованное имя хоста из URL или голого домена"""
+    if '://' not in url:
+        url = 'https://' + url
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    host = host.rstrip('.').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    return host or None
+
+
+def _read_domain_file(path: str) -> List[str]:
+    """Читает список доменов: по одному в строке, поддерживается формат hosts-файлов"""
+    domains = []
+    with open(path, encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split()
+            # Формат hosts: "0.0.0.0 domain.com"
+            domain = parts[1] if len(parts) > 1 else parts[0]
+            domain = extract_host(domain)
+            if domain and domain not in ('localhost', '0.0.0.0'):
+                domains.append(domain)
+    return domains
+
+
+class DomainReputationIndex:
+    """Локальный индекс репутации доменов перед проверкой через VirusTotal"""
+
+    def __init__(self, allowlist_path: Optional[str] = None,
+                 denylist_paths: Optional[List[str]] = None,
+                 public_suffix_path: Optional[str] = None,
+                 default_allowed: Optional[Iterable[str]] = None,
+                 fingerprint_threshold: int = 100000):
+        self.allowlist_path = allowlist_path
+        self.denylist_paths = list(denylist_paths or [])
+        self.public_suffix_path = public_suffix_path
+        self.default_allowed = list(default_allowed or [])
+        self.fingerprint_threshold = fingerprint_threshold
+
+        self._lock = threading.Lock()
+        self._mtimes = {}
+        # Домены, добавленные во время работы, переживают перезагрузку файлов
+        self._runtime_allowed = set()
+        self._runtime_denied = set()
+        # (allowlist, denylist, fingerprints) заменяются одним присваиванием при перезагрузке
+        self._state: Tuple[Set[str], Set[str], Optional[FingerprintSet]] = (set(), set(), None)
+        self.psl = PublicSuffixList()
+        self.reload(force=True)
+
+    def _current_mtimes(self) -> dict:
+        paths = [self.allowlist_path, self.public_suffix_path] + self.denylist_paths
+        mtimes = {}
+        for path in paths:
+            if path and os.path.exists(path):
+                mtimes[path] = os.path.getmtime(path)
+        return mtimes
+
+    def reload(self, force: bool = False) -> bool:
+        """Перезагружает списки, если файлы изменились. Возвращает True при перезагрузке"""
+        with self._lock:
+            mtimes = self._current_mtimes()
+            if not force and mtimes == self._mtimes:
+                return False
+
+            if self.public_suffix_path and self.public_suffix_path in mtimes:
+                try:
+                    self.psl = PublicSuffixList.from_file(self.public_suffix_path)
+                except Exception as e:
+                    logger.error(f"Public suffix list loading error: {str(e)}")
+
+            allowlist = set(extract_host(d) or d for d in self.default_allowed)
+            allowlist.update(self._runtime_allowed)
+            if self.allowlist_path in mtimes:
+                try:
+                    allowlist.update(_read_domain_file(self.allowlist_path))
+                except Exception as e:
+                    logger.error(f"Allowlist loading error: {str(e)}")
+
+            denied = []
+            for path in self.denylist_paths:
+                if path not in mtimes:
+                    continue
+                try:
+                    denied.extend(_read_domain_file(path))
+                except Exception as e:
+                    logger.error(f"Denylist loading error ({path}): {str(e)}")
+
+            # Большие блоклисты храним отпечатками, маленькие - множеством строк
+            if len(denied) > self.fingerprint_threshold:
+                fingerprints = FingerprintSet(denied)
+                denylist = set(self._runtime_denied)
+                logger.info(
+                    f"Domain denylist loaded as fingerprints: {len(fingerprints)} domains, "
+                    f"{fingerprints.size_bytes // 1024} KiB"
+                )
+            else:
+                fingerprints = None
+                denylist = set(denied)
+                denylist.update(self._runtime_denied)
+                logger.info(f"Domain denylist loaded: {len(denylist)} domains")
+
+            self._state = (allowlist, denylist, fingerprints)
+            self._mtimes = mtimes
+            logger.info(f"Domain allowlist loaded: {len(allowlist)} domains")
+            return True
+
+    def add_allowed(self, domain: str) -> None:
+        """Добавляет домен в allowlist во время работы"""
+        host = extract_host(domain)
+        if host:
+            self._runtime_allowed.add(host)
+            self._state[0].add(host)
+
+    def add_denied(self, domain: str) -> None:
+        """Добавляет домен в denylist во время работы"""
+        host = extract_host(domain)
+        if host:
+            self._runtime_denied.add(host)
+            self._state[1].add(host)
+
+    def _candidates(self, host: str) -> List[str]:
+        """Хост и его родительские домены вплоть до eTLD+1"""
+        registrable = self.psl.registrable_domain(host)
+        candidates = [host]
+        while host != registrable and '.' in host:
+            host = host.split('.', 1)[1]
+            candidates.append(host)
+        return candidates
+
+    def check_host(self, host: str) -> str:
+        """Вердикт для нормализованного хоста"""
+        allowlist, denylist, fingerprints = self._state
+        candidates = self._candidates(host)
+        # Denylist приоритетнее: вредоносный поддомен разрешенного хостинга должен блокироваться
+        for candidate in candidates:
+            if candidate in denylist or (fingerprints is not None and candidate in fingerprints):
+                return VERDICT_DENY
+        for candidate in candidates:
+            if candidate in allowlist:
+                return VERDICT_ALLOW
+        return VERDICT_UNKNOWN
+
+    def check_url(self, url: str) -> Tuple[str, Optional[str]]:
+        """Вердикт для URL: (verdict, host)"""
+        host = extract_host(url)
+        if not host:
+            return VERDICT_UNKNOWN, None
+        return self.check_host(host), host
+
+    def stats(self) -> dict:
+        allowlist, denylist, fingerprints = self._state
+        return {
+            'allowlist': len(allowlist),
+            'denylist': len(denylist),
+            'fingerprint_entries': len(fingerprints) if fingerprints is not None else 0,
+            'fingerprint_bytes': fingerprints.size_bytes if fingerprints is not None else 0,
+        }
+
+
+# Инициализация индекса
+try:
+    domain_index = DomainReputationIndex(
+        allowlist_path=getattr(Config, 'DOMAIN_ALLOWLIST_PATH', None),
+        denylist_paths=getattr(Config, 'DOMAIN_DENYLIST_PATHS', []),
+        public_suffix_path=getattr(Config, 'PUBLIC_SUFFIX_LIST_PATH', None),
+        default_allowed=getattr(Config, 'DEFAULT_ALLOWED_DOMAINS', []),
+        fingerprint_threshold=getattr(Config, 'DOMAIN_FINGERPRINT_THRESHOLD', 100000),
+    )
+except Exception as e:
+    logger.error(f"Domain reputation index initialization error: {str(e)}")
+    domain_index = None
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import time
+import asyncio
+import logging
+from collections import deque, OrderedDict
+from datetime import datetime, timedelta, timezone
+from telegram import ChatPermissions
+from telegram.error import RetryAfter
+from config import Config
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Максимум сообщений в одном вызове deleteMessages
+BULK_DELETE_LIMIT = 100
+
+
+class EnforcementQueue:
+    """
+    Ограниченный по частоте исходящий канал модерационных действий.
+
+    Удаления накапливаются по чатам и отправляются пачками через deleteMessages,
+    ограничения и сообщения выполняются по очереди. Повторные действия
+    для одного и того же пользователя схлопываются.
+    """
+
+    def __init__(self, rate_per_second: float = 20):
+        self.rate_per_second = rate_per_second
+        self._bot = None
+        self._worker = None
+        self._wakeup = None
+        self._deletes: 'OrderedDict[int, list]' = OrderedDict()
+        self._actions = deque()
+        self._pending_keys = set()
+        self._tokens = rate_per_second
+        self._last_refill = time.monotonic()
+        self.calls = 0
+        self.deleted = 0
+        self.restricted = 0
+
+    def _ensure_worker(self, bot) -> None:
+        self._bot = bot
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        self._wakeup.set()
+
+    def delete(self, bot, chat_id: int, message_id: int) -> None:
+        """Поставить сообщение в очередь на удаление"""
+        self._deletes.setdefault(chat_id, []).append(message_id)
+        self._ensure_worker(bot)
+
+    def restrict(self, bot, chat_id: int, user_id: int, duration: int) -> None:
+        """Запретить пользователю писать на duration секунд"""
+        key = ('restrict', chat_id, user_id)
+        if key in self._pending_keys:
+            return
+        self._pending_keys.add(key)
+        self._actions.append((key, duration))
+        self._ensure_worker(bot)
+
+    def send(self, bot, chat_id: int, text: str) -> None:
+        """Отправить служебное сообщение в чат"""
+        self._actions.append((('send', chat_id, None), text))
+        self._ensure_worker(bot)
+
+    async def _acquire(self) -> None:
+        """Токен-бакет: не больше rate_per_second вызовов API в секунду"""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.rate_per_second, self._tokens + (now - self._last_refill) * self.rate_per_second)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.calls += 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate_per_second)
+
+    async def _call(self, coro_factory) -> None:
+        """Вызов API с учетом RetryAfter"""
+        for _ in range(3):
+            await self._acquire()
+            try:
+                await coro_factory()
+                return
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                delay = retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after
+                logger.warning(f"Flood control, retrying enforcement in {delay} sec")
+                await asyncio.sleep(delay)
+
+    async def _delete_batch(self, chat_id: int, message_ids: list) -> None:
+        bot = self._bot
+        try:
+            if hasattr(bot, 'delete_messages'):
+                await self._call(lambda: bot.delete_messages(chat_id, message_ids))
+            else:
+                for message_id in message_ids:
+                    await self._call(lambda: bot.delete_message(chat_id, message_id))
+            self.deleted += len(message_ids)
+        except Exception as e:
+            logger.error(f"Bulk delete error in chat {chat_id}: {str(e)}")
+
+    async def _run_action(self, key, payload) -> None:
+        kind, chat_id, user_id = key
+        bot = self._bot
+        try:
+            if kind == 'restrict':
+                until = datetime.now(timezone.utc) + timedelta(seconds=payload)
+                await self._call(lambda: bot.restrict_chat_member(
+                    chat_id, user_id, ChatPermissions(can_send_messages=False), until_date=until
+                ))
+                self.restricted += 1
+            elif kind == 'send':
+                await self._call(lambda: bot.send_message(chat_id, payload))
+        except Exception as e:
+            logger.error(f"Enforcement {kind} error in chat {chat_id}: {str(e)}")
+        finally:
+            self._pending_keys.discard(key)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._deletes and not self._actions:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # Удаления выполняются первыми: они убирают спам из чата
+            if self._deletes:
+                chat_id = next(iter(self._deletes))
+                message_ids = self._deletes[chat_id]
+                batch, rest = message_ids[:BULK_DELETE_LIMIT], message_ids[BULK_DELETE_LIMIT:]
+                if rest:
+                    self._deletes[chat_id] = rest
+                    self._deletes.move_to_end(chat_id)
+                else:
+                    del self._deletes[chat_id]
+                await self._delete_batch(chat_id, batch)
+                continue
+
+            key, payload = self._actions.popleft()
+            await self._run_action(key, payload)
+
+    def stats(self) -> dict:
+        return {
+            'pending_deletes': sum(len(ids) for ids in self._deletes.values()),
+            'pending_actions': len(self._actions),
+            'calls': self.calls,
+            'deleted': self.deleted,
+            'restricted': self.restricted,
+        }
+
+
+enforcement_queue = EnforcementQueue(rate_per_second=getattr(Config, 'ENFORCEMENT_RATE_PER_SECOND', 20))
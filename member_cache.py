@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from config import Config
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Статусы, при которых пользователь отсутствует в чате
+ABSENT_STATUSES = ('left', 'kicked')
+
+
+class MemberInfo:
+    """Закешированный статус участника чата"""
+    __slots__ = ('status', 'username', 'expires_at')
+
+    def __init__(self, status: str, username: Optional[str], expires_at: float):
+        self.status = status
+        self.username = username
+        self.expires_at = expires_at
+
+    @property
+    def is_present(self) -> bool:
+        return self.status not in ABSENT_STATUSES
+
+
+class ChatMemberCache:
+    """
+    Кеш статусов участников по ключу (chat_id, user_id).
+
+    Заполняется из уже получаемых обновлений (сообщения, ChatMemberUpdated),
+    при промахе делает один запрос get_chat_member на ключ (single-flight).
+    """
+
+    def __init__(self, ttl: float = 600, max_size: int = 100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: 'OrderedDict[Tuple[int, int], MemberInfo]' = OrderedDict()
+        self._inflight: Dict[Tuple[int, int], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def set(self, chat_id: int, user_id: int, status: str, username: Optional[str] = None) -> None:
+        """Записывает известный статус участника"""
+        key = (chat_id, user_id)
+        entry = self._entries.get(key)
+        if username is None and entry is not None:
+            username = entry.username
+        self._entries[key] = MemberInfo(status, username, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, chat_id: int, user_id: int) -> None:
+        self._entries.pop((chat_id, user_id), None)
+
+    def peek(self, chat_id: int, user_id: int) -> Optional[MemberInfo]:
+        """Возвращает актуальную запись без обращения к API"""
+        key = (chat_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def observe_user(self, chat_id: int, user) -> None:
+        """Отмечает автора сообщения как присутствующего в чате"""
+        if user is None:
+            return
+        entry = self._entries.get((chat_id, user.id))
+        # Сохраняем более точный статус (administrator, restricted), если он уже известен
+        if entry is not None and entry.is_present:
+            entry.username = user.username
+            entry.expires_at = time.monotonic() + self.ttl
+            self._entries.move_to_end((chat_id, user.id))
+        else:
+            self.set(chat_id, user.id, 'member', user.username)
+
+    def observe_member(self, chat_id: int, member) -> None:
+        """Обновление из объекта ChatMember"""
+        self.set(chat_id, member.user.id, member.status, member.user.username)
+
+    async def get(self, chat_id: int, user_id: int,
+                  fetch: Callable[[int, int], Awaitable]) -> MemberInfo:
+        """Возвращает статус участника, при промахе запрашивает его через fetch"""
+        entry = self.peek(chat_id, user_id)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        key = (chat_id, user_id)
+        future = self._inflight.get(key)
+        if future is not None:
+            # Запрос по этому ключу уже выполняется - ждем его результата
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Отменен владелец запроса, а не мы: запрашиваем заново
+                if not future.cancelled():
+                    raise
+                return await self.get(chat_id, user_id, fetch)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            member = await fetch(chat_id, user_id)
+            self.observe_member(chat_id, member)
+            entry = self._entries[key]
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже получит вызывающий код, не даем asyncio ругаться на непрочитанное
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            # Владелец запроса отменен: ожидающие не должны зависнуть на future
+            if not future.done():
+                future.cancel()
+
+    def cleanup(self) -> int:
+        """Удаляет просроченные записи, возвращает их количество"""
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if entry.expires_at < now]
+        for key in expired:
+            del self._entries[key]
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+member_cache = ChatMemberCache(
+    ttl=getattr(Config, 'MEMBER_CACHE_TTL', 600),
+    max_size=getattr(Config, 'MEMBER_CACHE_MAX_SIZE', 100000)
+)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import sys
+import pstats
+import asyncio
+import cProfile
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+from config import Config
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+MAX_PROFILE_SECONDS = 300
+
+
+class StackSampler:
+    """Периодический снимок стеков всех потоков в формате folded stacks (flamegraph.pl, speedscope)"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write_folded(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Профилирование по запросу администратора.
+
+    В выключенном состоянии ничего не установлено: ни трассировки, ни проверок
+    в обработчиках. Сессия включает cProfile в потоке event loop (обработчики),
+    сэмплер стеков всех потоков и torch-профайлер в потоке инференса.
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.active = False
+
+    async def _start_torch_profiler(self, run_in_inference_thread):
+        """Torch-профайлер запускается в потоке, где выполняется модель"""
+        try:
+            import torch
+            from torch.profiler import profile, ProfilerActivity
+        except ImportError:
+            return None
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        torch_profiler = profile(activities=activities, record_shapes=True)
+        try:
+            if run_in_inference_thread is not None:
+                await run_in_inference_thread(torch_profiler.start)
+            else:
+                torch_profiler.start()
+        except Exception as e:
+            # Профилирование обработчиков продолжается и без отчета по операторам
+            logger.error(f"Torch profiler start error: {str(e)}")
+            return None
+        return torch_profiler
+
+    def start(self, duration: float, run_in_inference_thread=None) -> Optional[asyncio.Task]:
+        """
+        Запуск профилирования в фоне на duration секунд
+
+        Сессия занимается синхронно, до первого await, поэтому две команды
+        подряд не могут запустить две сессии.
+
+        Args:
+            duration (float): Длительность окна в секундах
+            run_in_inference_thread: Корутина-функция для выполнения вызова в потоке инференса
+
+        Returns:
+            Optional[asyncio.Task]: Задача, возвращающая каталог с отчетами, или None, если сессия уже идет
+        """
+        if self.active:
+            return None
+        self.active = True
+        try:
+            return asyncio.get_running_loop().create_task(self._run(duration, run_in_inference_thread))
+        except Exception:
+            self.active = False
+            raise
+
+    async def _run(self, duration: float, run_in_inference_thread) -> str:
+        duration = max(1, min(duration, MAX_PROFILE_SECONDS))
+        report_dir = os.path.join(self.output_dir, datetime.now().strftime('%Y%m%d-%H%M%S'))
+
+        handler_profiler = cProfile.Profile()
+        sampler = StackSampler()
+        torch_profiler = None
+        try:
+            os.makedirs(report_dir, exist_ok=True)
+            torch_profiler = await self._start_torch_profiler(run_in_inference_thread)
+            sampler.start()
+            handler_profiler.enable()
+            logger.info(f"Profiling started for {duration} sec")
+
+            await asyncio.sleep(duration)
+        finally:
+            handler_profiler.disable()
+            sampler.stop()
+            if torch_profiler is not None:
+                try:
+                    if run_in_inference_thread is not None:
+                        await run_in_inference_thread(torch_profiler.stop)
+                    else:
+                        torch_profiler.stop()
+                except Exception as e:
+                    logger.error(f"Torch profiler stop error: {str(e)}")
+            self.active = False
+
+        # Отчеты пишутся вне event loop
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._write_reports, report_dir, handler_profiler, sampler, torch_profiler)
+        logger.info(f"Profiling reports written to {report_dir}")
+        return report_dir
+
+    @staticmethod
+    def _write_reports(report_dir: str, handler_profiler, sampler: StackSampler, torch_profiler) -> None:
+        # cProfile: бинарный дамп (snakeviz, gprof2dot) и текстовая сводка
+        handler_profiler.dump_stats(os.path.join(report_dir, 'handlers.prof'))
+        summary = io.StringIO()
+        pstats.Stats(handler_profiler, stream=summary).sort_stats('cumulative').print_stats(50)
+        with open(os.path.join(report_dir, 'handlers.txt'), 'w', encoding='utf-8') as f:
+            f.write(summary.getvalue())
+
+        # Стеки всех потоков для flamegraph
+        sampler.write_folded(os.path.join(report_dir, 'stacks.folded'))
+
+        # Операторы модели
+        if torch_profiler is not None:
+            try:
+                averages = torch_profiler.key_averages()
+                with open(os.path.join(report_dir, 'torch_ops.txt'), 'w', encoding='utf-8') as f:
+                    f.write(averages.table(sort_by='self_cpu_time_total', row_limit=50))
+                torch_profiler.export_chrome_trace(os.path.join(report_dir, 'torch_trace.json'))
+            except Exception as e:
+                logger.error(f"Torch profiler report error: {str(e)}")
+
+
+profiler = Profiler(getattr(Config, 'PROFILE_DIR', 'app/profiles'))
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import time
+import logging
+from collections import deque, OrderedDict
+from typing import Dict, List, Optional
+from config import Config
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+class ChatRaidState:
+    """Счетчики вступлений и первых сообщений в одном чате"""
+    __slots__ = ('joins', 'first_messages', 'new_members', 'spoken', 'raid_until', 'raids')
+
+    def __init__(self):
+        self.joins = deque()           # Время вступлений за окно
+        self.first_messages = deque()  # Время первых сообщений новичков за окно
+        self.new_members: 'OrderedDict[int, float]' = OrderedDict()  # user_id -> время вступления
+        self.spoken = set()            # Новички, чье первое сообщение уже учтено
+        self.raid_until = 0.0
+        self.raids = 0
+
+
+class RaidGuard:
+    """
+    Определение рейдов по частоте вступлений и первых сообщений новичков.
+
+    Во время рейда чат переходит на строгую дешевую политику: новички
+    ограничиваются при вступлении, тяжелые проверки (BERT, VirusTotal) не выполняются.
+    """
+
+    def __init__(self, join_threshold: int = 10, first_message_threshold: int = 10,
+                 window: float = 60, raid_duration: float = 600, new_member_window: float = 600,
+                 max_new_members: int = 10000):
+        self.join_threshold = join_threshold
+        self.first_message_threshold = first_message_threshold
+        self.window = window
+        self.raid_duration = raid_duration
+        self.new_member_window = new_member_window
+        self.max_new_members = max_new_members
+        self._chats: Dict[int, ChatRaidState] = {}
+
+    def _state(self, chat_id: int) -> ChatRaidState:
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = ChatRaidState()
+        return state
+
+    def _trim(self, events: deque, now: float) -> None:
+        border = now - self.window
+        while events and events[0] < border:
+            events.popleft()
+
+    def _check_trigger(self, chat_id: int, state: ChatRaidState, now: float) -> bool:
+        """Включает режим рейда при превышении порогов. True, если рейд только что начался"""
+        if len(state.joins) < self.join_threshold and len(state.first_messages) < self.first_message_threshold:
+            return False
+        started = state.raid_until <= now
+        state.raid_until = now + self.raid_duration
+        if started:
+            state.raids += 1
+            logger.warning(
+                f"Raid detected in chat {chat_id}: {len(state.joins)} joins, "
+                f"{len(state.first_messages)} first messages in {self.window} sec"
+            )
+        return started
+
+    def record_join(self, chat_id: int, user_id: int) -> Optional[bool]:
+        """
+        Учет вступления
+
+        Returns:
+            Optional[bool]: True, если этим вступлением начался рейд;
+            None, если это повтор уже учтенного вступления
+        """
+        now = time.monotonic()
+        state = self._state(chat_id)
+        # Вступление приходит и сервисным сообщением, и chat_member - считаем один раз
+        joined = state.new_members.get(user_id)
+        if joined is not None and now - joined < self.window:
+            return None
+
+        state.new_members[user_id] = now
+        state.new_members.move_to_end(user_id)
+        state.spoken.discard(user_id)
+        if len(state.new_members) > self.max_new_members:
+            evicted, _ = state.new_members.popitem(last=False)
+            state.spoken.discard(evicted)
+
+        state.joins.append(now)
+        self._trim(state.joins, now)
+        return self._check_trigger(chat_id, state, now)
+
+    def record_message(self, chat_id: int, user_id: int) -> bool:
+        """Учет сообщения. Возвращает True, если этим сообщением начался рейд"""
+        state = self._chats.get(chat_id)
+        if state is None:
+            return False
+        if user_id not in state.new_members or user_id in state.spoken:
+            return False
+
+        now = time.monotonic()
+        state.spoken.add(user_id)
+        state.first_messages.append(now)
+        self._trim(state.first_messages, now)
+        return self._check_trigger(chat_id, state, now)
+
+    def is_raid(self, chat_id: int) -> bool:
+        state = self._chats.get(chat_id)
+        return state is not None and state.raid_until > time.monotonic()
+
+    def is_new_member(self, chat_id: int, user_id: int) -> bool:
+        """Пользователь вступил в чат недавно"""
+        state = self._chats.get(chat_id)
+        if state is None:
+            return False
+        joined = state.new_members.get(user_id)
+        return joined is not None and time.monotonic() - joined < self.new_member_window
+
+    def recent_joiners(self, chat_id: int) -> List[int]:
+        """Пользователи, вступившие за окно обнаружения (для массового ограничения)"""
+        state = self._chats.get(chat_id)
+        if state is None:
+            return []
+        border = time.monotonic() - self.window
+        return [user_id for user_id, joined in state.new_members.items() if joined >= border]
+
+    def activate(self, chat_id: int, duration: Optional[float] = None) -> None:
+        """Ручное включение режима рейда"""
+        state = self._state(chat_id)
+        if state.raid_until <= time.monotonic():
+            state.raids += 1
+        state.raid_until = time.monotonic() + (duration or self.raid_duration)
+
+    def reset(self, chat_id: int) -> None:
+        """Выключение режима рейда и сброс счетчиков"""
+        state = self._chats.get(chat_id)
+        if state is not None:
+            state.raid_until = 0.0
+            state.joins.clear()
+            state.first_messages.clear()
+
+    def status(self, chat_id: int) -> dict:
+        now = time.monotonic()
+        state = self._chats.get(chat_id) or ChatRaidState()
+        self._trim(state.joins, now)
+        self._trim(state.first_messages, now)
+        return {
+            'active': state.raid_until > now,
+            'remaining': max(0, int(state.raid_until - now)),
+            'joins': len(state.joins),
+            'first_messages': len(state.first_messages),
+            'new_members': sum(1 for joined in state.new_members.values() if now - joined < self.new_member_window),
+            'raids': state.raids,
+        }
+
+    def cleanup(self) -> int:
+        """Удаляет устаревшие записи о новичках и пустые чаты"""
+        now = time.monotonic()
+        removed = 0
+        for chat_id in list(self._chats):
+            state = self._chats[chat_id]
+            while state.new_members:
+                user_id, joined = next(iter(state.new_members.items()))
+                if now - joined < self.new_member_window:
+                    break
+                del state.new_members[user_id]
+                state.spoken.discard(user_id)
+            self._trim(state.joins, now)
+            self._trim(state.first_messages, now)
+            if not state.new_members and not state.joins and state.raid_until <= now:
+                del self._chats[chat_id]
+                removed += 1
+        return removed
+
+
+raid_guard = RaidGuard(
+    join_threshold=getattr(Config, 'RAID_JOIN_THRESHOLD', 10),
+    first_message_threshold=getattr(Config, 'RAID_FIRST_MESSAGE_THRESHOLD', 10),
+    window=getattr(Config, 'RAID_WINDOW', 60),
+    raid_duration=getattr(Config, 'RAID_DURATION', 600),
+    new_member_window=getattr(Config, 'RAID_NEW_MEMBER_WINDOW', 600)
+)
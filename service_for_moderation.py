@@ -1,9 +1,14 @@
 import torch
-from transformers import BertModel, BertTokenizer, BertConfig
+from transformers import BertModel, BertTokenizer, BertTokenizerFast, BertConfig
 import numpy as np
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import os
+import time
+import queue
+import random
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from sklearn.linear_model import LogisticRegression
 import torch.serialization
 
@@ -17,6 +22,16 @@ logger = logging.getLogger(__name__)
 # Разрешаем загрузку scikit-learn моделей
 torch.serialization.add_safe_globals([LogisticRegression])
 
+# Тексты для сверки быстрого токенизатора с эталонным
+TOKENIZER_PARITY_TEXTS = [
+    "Привет, как дела?",
+    "ПРИВЕТ всем!!! Заходите на https://t.me/channel и www.example.com",
+    "Mixed текст with English words, цифрами 12345 и эмодзи 😀👍",
+    "ёжик в тумане, Ёлка и йод",
+    "   лишние   пробелы\tи\nпереносы   ",
+    "слово " * 600,  # Длиннее max_length - проверка обрезки
+]
+
 class ToxicityClassifier:
     def __init__(self, model_path: str):
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -28,6 +43,9 @@ class ToxicityClassifier:
         
         self._load_model(model_path)
         self._init_tokenizer()
+        # Токенизация следующего пакета идет в отдельном потоке параллельно с моделью
+        self._tokenize_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tokenizer")
+        self._buffers = threading.local()
         logger.info("Toxicity classifier initialized successfully")
 
     def _load_model(self, model_path: str) -> None:
@@ -62,26 +80,53 @@ class ToxicityClassifier:
             logger.error(f"Model loading error: {str(e)}")
             raise RuntimeError(f"Model loading error: {str(e)}")
 
+    @staticmethod
+    def _load_tokenizer(tokenizer_class):
+        tokenizer = tokenizer_class.from_pretrained(
+            'DeepPavlov/rubert-base-cased',
+            do_lower_case=False,
+            padding_side='right'
+        )
+        
+        # Гарантируем наличие специальных токенов
+        if tokenizer.pad_token is None:
+            tokenizer.add_special_tokens({'pad_token': '[PAD]'})
+        if tokenizer.unk_token is None:
+            tokenizer.add_special_tokens({'unk_token': '[UNK]'})
+        return tokenizer
+
     def _init_tokenizer(self) -> None:
-        """Инициализация токенизатора"""
+        """Инициализация токенизатора (быстрый на Rust, если совпадает с эталонным)"""
         try:
-            self.tokenizer = BertTokenizer.from_pretrained(
-                'DeepPavlov/rubert-base-cased',
-                do_lower_case=False,
-                padding_side='right'
-            )
-            
-            # Гарантируем наличие специальных токенов
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.add_special_tokens({'pad_token': '[PAD]'})
-            if self.tokenizer.unk_token is None:
-                self.tokenizer.add_special_tokens({'unk_token': '[UNK]'})
-                
-            logger.info("Tokenizer initialized successfully")
+            self.tokenizer = self._load_tokenizer(BertTokenizer)
+            self.is_fast_tokenizer = False
         except Exception as e:
             logger.error(f"Tokenizer initialization error: {str(e)}")
             raise RuntimeError(f"Tokenizer initialization error: {str(e)}")
 
+        try:
+            fast_tokenizer = self._load_tokenizer(BertTokenizerFast)
+            mismatches = self._check_tokenizer_parity(self.tokenizer, fast_tokenizer)
+            if mismatches:
+                logger.warning(f"Fast tokenizer differs from reference on {mismatches} texts, using slow tokenizer")
+            else:
+                self.tokenizer = fast_tokenizer
+                self.is_fast_tokenizer = True
+        except Exception as e:
+            logger.warning(f"Fast tokenizer unavailable, using slow tokenizer: {str(e)}")
+
+        logger.info(f"Tokenizer initialized successfully (fast: {self.is_fast_tokenizer})")
+
+    def _check_tokenizer_parity(self, reference, fast_tokenizer) -> int:
+        """Сверка результатов быстрого токенизатора с эталонным, возвращает число расхождений"""
+        max_length = self.params.get('max_length', 512)
+        expected = reference(TOKENIZER_PARITY_TEXTS, truncation=True, max_length=max_length)['input_ids']
+        backend = fast_tokenizer.backend_tokenizer
+        backend.enable_truncation(max_length)
+        backend.no_padding()
+        actual = [encoding.ids for encoding in backend.encode_batch(TOKENIZER_PARITY_TEXTS)]
+        return sum(1 for a, b in zip(expected, actual) if list(a) != list(b))
+
     def predict_toxicity(self, text: str) -> Tuple[bool, float]:
         """
         Предсказание токсичности для одного текста
@@ -99,18 +144,19 @@ class ToxicityClassifier:
             logger.error(f"Prediction error: {str(e)}")
             return False, 0.0
 
-    def predict(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    def predict(self, texts: List[str], batch_size: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
         """
         Пакетное предсказание токсичности
         
         Args:
             texts (List[str]): Список текстов для анализа
+            batch_size (Optional[int]): Размер пакета для прохода модели (по умолчанию из параметров чекпоинта)
             
         Returns:
             Tuple[np.ndarray, np.ndarray]: (predictions, probabilities)
         """
         try:
-            embeddings = self._get_embeddings(texts)
+            embeddings = self._get_embeddings(texts, batch_size)
             if len(embeddings) == 0:
                 return np.array([]), np.array([])
                 
@@ -121,55 +167,328 @@ class ToxicityClassifier:
             logger.error(f"Prediction error: {str(e)}")
             return np.array([]), np.array([])
 
-    def _get_embeddings(self, texts: List[str]) -> np.ndarray:
+    def _get_buffers(self, batch_size: int, max_length: int) -> list:
+        """
+        Два набора заранее выделенных буферов входов модели на поток:
+        пока один пакет в модели, следующий токенизируется во второй набор
+        """
+        buffers = getattr(self._buffers, 'slots', None)
+        if buffers is None or buffers[0]['input_ids'].shape[0] < batch_size \
+                or buffers[0]['input_ids'].shape[1] < max_length:
+            buffers = []
+            for _ in range(2):
+                arrays = {
+                    name: np.zeros((batch_size, max_length), dtype=np.int64)
+                    for name in ('input_ids', 'token_type_ids', 'attention_mask')
+                }
+                # Тензоры разделяют память с массивами numpy
+                buffers.append({name: (array, torch.from_numpy(array)) for name, array in arrays.items()})
+            self._buffers.slots = buffers
+        return buffers
+
+    def _tokenize(self, batch: List[str], max_length: int, buffers: dict) -> dict:
+        """Токенизация пакета в заранее выделенные буферы"""
+        if not self.is_fast_tokenizer:
+            return dict(self.tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=max_length,
+                return_tensors="pt"
+            ))
+
+        backend = self.tokenizer.backend_tokenizer
+        backend.enable_truncation(max_length)
+        backend.no_padding()
+        encodings = backend.encode_batch(batch)
+
+        rows = len(encodings)
+        length = max(len(encoding.ids) for encoding in encodings)
+        input_ids, input_ids_tensor = buffers['input_ids']
+        token_type_ids, token_type_ids_tensor = buffers['token_type_ids']
+        attention_mask, attention_mask_tensor = buffers['attention_mask']
+
+        input_ids[:rows, :length] = self.tokenizer.pad_token_id
+        token_type_ids[:rows, :length] = 0
+        attention_mask[:rows, :length] = 0
+        for row, encoding in enumerate(encodings):
+            size = len(encoding.ids)
+            input_ids[row, :size] = encoding.ids
+            token_type_ids[row, :size] = encoding.type_ids
+            attention_mask[row, :size] = 1
+
+        return {
+            'input_ids': input_ids_tensor[:rows, :length],
+            'token_type_ids': token_type_ids_tensor[:rows, :length],
+            'attention_mask': attention_mask_tensor[:rows, :length],
+        }
+
+    def _get_embeddings(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
         """Получение эмбеддингов для списка текстов"""
         self.bert_model.eval()
         embeddings = []
+        if not texts:
+            return np.array([])
         
-        batch_size = self.params.get('batch_size', 8)
+        batch_size = batch_size or self.params.get('batch_size', 8)
         max_length = self.params.get('max_length', 512)
+        buffers = self._get_buffers(batch_size, max_length)
         
         i = 0
+        slot = 0
+        pending = self._tokenize_pool.submit(self._tokenize, texts[i:i + batch_size], max_length, buffers[slot])
         while i < len(texts):
-            batch = texts[i:i + batch_size]
+            next_i = i + batch_size
+            try:
+                inputs = pending.result()
+            except Exception as e:
+                logger.error(f"Tokenization error: {str(e)}")
+                i = next_i
+                if i < len(texts):
+                    pending = self._tokenize_pool.submit(self._tokenize, texts[i:i + batch_size], max_length, buffers[slot])
+                continue
+
+            # Следующий пакет токенизируется, пока текущий обрабатывается моделью
+            next_slot = 1 - slot
+            pending = None
+            if next_i < len(texts):
+                pending = self._tokenize_pool.submit(
+                    self._tokenize, texts[next_i:next_i + batch_size], max_length, buffers[next_slot]
+                )
             
             try:
-                inputs = self.tokenizer(
-                    batch,
-                    padding=True,
-                    truncation=True,
-                    max_length=max_length,
-                    return_tensors="pt"
-                ).to(self.device)
-                
+                inputs = {name: tensor.to(self.device) for name, tensor in inputs.items()}
                 with torch.no_grad():
                     outputs = self.bert_model(**inputs)
                 
                 batch_embeddings = outputs.last_hidden_state[:, 0, :].cpu().numpy()
                 embeddings.append(batch_embeddings)
-                i += batch_size
                 
             except RuntimeError as e:
                 if "CUDA out of memory" in str(e) and batch_size > 1:
                     batch_size = max(1, batch_size // 2)
                     logger.warning(f"GPU memory error, reducing batch size to {batch_size}")
+                    # Заготовленный пакет другого размера больше не нужен
+                    if pending is not None:
+                        wait([pending])
+                    pending = self._tokenize_pool.submit(self._tokenize, texts[i:i + batch_size], max_length, buffers[slot])
                     continue
                 logger.error(f"Batch processing error: {str(e)}")
-                i += batch_size
             except Exception as e:
                 logger.error(f"Batch processing error: {str(e)}")
-                i += batch_size
+
+            i = next_i
+            slot = next_slot
                 
         return np.concatenate(embeddings, axis=0) if embeddings else np.array([])
 
+# Тексты для прогрева модели перед переключением
+WARMUP_TEXTS = [
+    "Привет, как дела?",
+    "Это сообщение нужно только для прогрева модели.",
+    "Спасибо всем за помощь!",
+]
+
+class ModelManager:
+    """
+    Управление чекпоинтами классификатора без перезапуска бота.
+
+    Новый чекпоинт загружается и прогревается в фоне как кандидат, затем
+    атомарно заменяет активную модель. Запросы, начатые на старой модели,
+    дорабатывают на ней. В теневом режиме часть трафика пакетно оценивается
+    обеими моделями для сравнения задержки и согласованности.
+    """
+
+    def __init__(self, model_path: str, shadow_sample_rate: float = 0.0,
+                 shadow_batch_size: int = 16, shadow_queue_size: int = 1000):
+        self.active: Optional[ToxicityClassifier] = None
+        self.active_path = model_path
+        self.candidate: Optional[ToxicityClassifier] = None
+        self.candidate_path: Optional[str] = None
+        self.shadow_sample_rate = shadow_sample_rate
+        self.shadow_batch_size = shadow_batch_size
+
+        self._lock = threading.Lock()
+        self._loading = False
+        self._shadow_queue = queue.Queue(maxsize=shadow_queue_size)
+        self._reset_shadow_stats()
+
+        try:
+            self.active = ToxicityClassifier(model_path)
+        except Exception as e:
+            logger.error(f"Classifier initialization error: {str(e)}")
+
+        self._shadow_thread = threading.Thread(target=self._shadow_worker, name="shadow-scoring", daemon=True)
+        self._shadow_thread.start()
+
+    def _reset_shadow_stats(self) -> None:
+        self.shadow_stats = {
+            'samples': 0,
+            'agreements': 0,
+            'dropped': 0,
+            'active_seconds': 0.0,
+            'candidate_seconds': 0.0,
+            'proba_abs_diff': 0.0,
+        }
+
+    @staticmethod
+    def _warm_up(classifier: ToxicityClassifier) -> None:
+        """Прогрев модели и проверка, что она отвечает на запросы"""
+        predictions, _ = classifier.predict(WARMUP_TEXTS)
+        if len(predictions) != len(WARMUP_TEXTS):
+            raise RuntimeError("Model warm-up failed")
+
+    def load_candidate(self, model_path: str, promote: bool = False) -> bool:
+        """
+        Загрузка и прогрев нового чекпоинта (блокирующий вызов, выполнять вне event loop)
+
+        Args:
+            model_path (str): Путь к чекпоинту
+            promote (bool): Сразу сделать модель активной после прогрева
+
+        Returns:
+            bool: True, если модель загружена
+        """
+        with self._lock:
+            if self._loading:
+                logger.warning("Model loading is already in progress")
+                return False
+            self._loading = True
+
+        try:
+            started = time.perf_counter()
+            classifier = ToxicityClassifier(model_path)
+            self._warm_up(classifier)
+            logger.info(f"Candidate model {model_path} loaded in {time.perf_counter() - started:.1f} sec")
+
+            with self._lock:
+                self.candidate = classifier
+                self.candidate_path = model_path
+                self._reset_shadow_stats()
+            if promote:
+                self.promote()
+            return True
+        except Exception as e:
+            logger.error(f"Candidate model loading error: {str(e)}")
+            return False
+        finally:
+            self._loading = False
+
+    def promote(self) -> bool:
+        """Атомарно делает кандидата активной моделью"""
+        with self._lock:
+            if self.candidate is None:
+                return False
+            self.active, self.active_path = self.candidate, self.candidate_path
+            self.candidate, self.candidate_path = None, None
+            self._reset_shadow_stats()
+        logger.info(f"Model {self.active_path} promoted to active")
+        return True
+
+    def discard_candidate(self) -> bool:
+        """Отказ от кандидата без переключения"""
+        with self._lock:
+            if self.candidate is None:
+                return False
+            self.candidate, self.candidate_path = None, None
+            self._reset_shadow_stats()
+        return True
+
+    def _sample_for_shadow(self, texts: List[str]) -> None:
+        if self.candidate is None or not self.shadow_sample_rate:
+            return
+        for text in texts:
+            if random.random() < self.shadow_sample_rate:
+                try:
+                    self._shadow_queue.put_nowait(text)
+                except queue.Full:
+                    self.shadow_stats['dropped'] += 1
+
+    def predict_toxicity(self, text: str) -> Tuple[bool, float]:
+        """Предсказание токсичности активной моделью (см. ToxicityClassifier.predict_toxicity)"""
+        model = self.active
+        if model is None:
+            return False, 0.0
+        result = model.predict_toxicity(text)
+        self._sample_for_shadow([text])
+        return result
+
+    def predict(self, texts: List[str], batch_size: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Пакетное предсказание активной моделью (см. ToxicityClassifier.predict)"""
+        model = self.active
+        if model is None:
+            return np.array([]), np.array([])
+        result = model.predict(texts, batch_size)
+        self._sample_for_shadow(texts)
+        return result
+
+    def _shadow_worker(self) -> None:
+        """Пакетная оценка выборки трафика обеими моделями"""
+        while True:
+            batch = [self._shadow_queue.get()]
+            while len(batch) < self.shadow_batch_size:
+                try:
+                    batch.append(self._shadow_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            active, candidate = self.active, self.candidate
+            if active is None or candidate is None:
+                continue
+            try:
+                started = time.perf_counter()
+                active_pred, active_proba = active.predict(batch)
+                active_time = time.perf_counter() - started
+
+                started = time.perf_counter()
+                candidate_pred, candidate_proba = candidate.predict(batch)
+                candidate_time = time.perf_counter() - started
+
+                if len(active_pred) != len(batch) or len(candidate_pred) != len(batch):
+                    continue
+                # Кандидат мог смениться, пока шла оценка
+                if candidate is not self.candidate:
+                    continue
+                stats = self.shadow_stats
+                stats['samples'] += len(batch)
+                stats['agreements'] += int((active_pred == candidate_pred).sum())
+                stats['active_seconds'] += active_time
+                stats['candidate_seconds'] += candidate_time
+                stats['proba_abs_diff'] += float(np.abs(active_proba - candidate_proba).sum())
+            except Exception as e:
+                logger.error(f"Shadow scoring error: {str(e)}")
+
+    def status(self) -> dict:
+        """Состояние моделей и результаты теневого сравнения"""
+        stats = self.shadow_stats
+        samples = stats['samples']
+        return {
+            'active_path': self.active_path if self.active is not None else None,
+            'candidate_path': self.candidate_path,
+            'loading': self._loading,
+            'shadow_sample_rate': self.shadow_sample_rate,
+            'shadow_samples': samples,
+            'shadow_dropped': stats['dropped'],
+            'agreement': stats['agreements'] / samples if samples else None,
+            'mean_proba_diff': stats['proba_abs_diff'] / samples if samples else None,
+            'active_ms_per_text': stats['active_seconds'] * 1000 / samples if samples else None,
+            'candidate_ms_per_text': stats['candidate_seconds'] * 1000 / samples if samples else None,
+        }
+
 # Инициализация классификатора
 try:
     from config import Config
-    toxicity_classifier = ToxicityClassifier(Config.MODEL_PATH)
-    logger.info("Moderation service initialized successfully")
+    model_manager = ModelManager(
+        Config.MODEL_PATH,
+        shadow_sample_rate=getattr(Config, 'SHADOW_SAMPLE_RATE', 0.0),
+        shadow_batch_size=getattr(Config, 'SHADOW_BATCH_SIZE', 16),
+        shadow_queue_size=getattr(Config, 'SHADOW_QUEUE_SIZE', 1000)
+    )
+    if model_manager.active is not None:
+        logger.info("Moderation service initialized successfully")
 except ImportError as e:
     logger.error("Error: Config module not found")
-    toxicity_classifier = None
+    model_manager = None
 except Exception as e:
     logger.error(f"Classifier initialization error: {str(e)}")
-    toxicity_classifier = None
\ No newline at end of file
+    model_manager = None
\ No newline at end of file
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from typing import Any, Awaitable, Dict, Tuple
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config import Config
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка обновлений разных чатов.
+
+    Обновления одного чата обрабатываются строго по очереди, как и при
+    последовательной обработке: проверки и изменения состояния (мут, флуд,
+    предупреждения) внутри обработчика не пересекаются. Разные чаты идут
+    параллельно, поэтому их сообщения попадают в общий пакет оценки токсичности.
+    Число обновлений в обработке и в очередях чатов доступно через load()
+    для выбора режима перегрузки.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._users: Dict[int, int] = {}  # chat_id -> число обновлений, ожидающих или держащих блокировку
+        self.running = 0  # Обновлений в обработчиках
+        self.waiting = 0  # Обновлений, ожидающих своей очереди в чате
+
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        self.running += 1
+        try:
+            await coroutine
+        finally:
+            self.running -= 1
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await self._run(coroutine)
+            return
+
+        chat_id = chat.id
+        lock = self._locks.get(chat_id)
+        if lock is None:
+            lock = self._locks[chat_id] = asyncio.Lock()
+        self._users[chat_id] = self._users.get(chat_id, 0) + 1
+        self.waiting += 1
+        acquired = False
+        try:
+            async with lock:
+                self.waiting -= 1
+                acquired = True
+                await self._run(coroutine)
+        finally:
+            if not acquired:
+                self.waiting -= 1
+            self._users[chat_id] -= 1
+            if not self._users[chat_id]:
+                del self._users[chat_id]
+                del self._locks[chat_id]
+
+    def load(self) -> Tuple[int, int]:
+        """(обновлений в обработчиках, обновлений в очередях чатов)"""
+        return self.running, self.waiting
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+update_processor = PerChatUpdateProcessor(getattr(Config, 'CONCURRENT_UPDATES', 256))
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+import logging
+from array import array
+from typing import Dict, Optional
+from config import Config
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Сколько самых давних записей просматривается при вытеснении
+EVICTION_SCAN_LIMIT = 64
+
+
+class UserState:
+    """Компактное состояние пользователя в чате: предупреждения, мут и окно флуда"""
+    __slots__ = ('warnings', 'muted_until', 'last_seen', 'flood')
+
+    def __init__(self, now: float):
+        self.warnings = 0
+        self.muted_until = 0.0    # time.monotonic() окончания мута, 0 - мута нет
+        self.last_seen = now
+        self.flood = None  # array('d') времени последних сообщений, создается при первом сообщении
+
+    def is_muted(self, now: float) -> bool:
+        return self.muted_until > now
+
+    def is_empty(self, now: float, window: float) -> bool:
+        """Состояние не несет информации и может быть удалено"""
+        return (not self.warnings
+                and not self.is_muted(now)
+                and (not self.flood or now - self.flood[-1] > window))
+
+
+def _pack_key(chat_id: int, user_id: int) -> int:
+    """Один int вместо кортежа (chat_id, user_id): user_id всегда положителен и < 2**64"""
+    return (chat_id << 64) | user_id
+
+
+class UserStateStore:
+    """Хранилище состояний пользователей с вытеснением неактивных записей"""
+
+    def __init__(self, flood_window: float, flood_limit: int,
+                 idle_ttl: float = 7 * 86400, max_entries: int = 1000000):
+        self.flood_window = flood_window
+        self.flood_limit = flood_limit
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        # Порядок вставки поддерживается как LRU: активные записи переносятся в конец
+        self._states: Dict[int, UserState] = {}
+
+    def get(self, chat_id: int, user_id: int) -> Optional[UserState]:
+        return self._states.get(_pack_key(chat_id, user_id))
+
+    def _get_or_create(self, chat_id: int, user_id: int, now: float) -> UserState:
+        key = _pack_key(chat_id, user_id)
+        state = self._states.pop(key, None)
+        if state is None:
+            state = UserState(now)
+            if len(self._states) >= self.max_entries:
+                self._evict_lru(now)
+        state.last_seen = now
+        self._states[key] = state
+        return state
+
+    def is_muted(self, chat_id: int, user_id: int) -> bool:
+        state = self.get(chat_id, user_id)
+        return state is not None and state.is_muted(time.monotonic())
+
+    def mute(self, chat_id: int, user_id: int, duration: float) -> None:
+        now = time.monotonic()
+        self._get_or_create(chat_id, user_id, now).muted_until = now + duration
+
+    def unmute(self, chat_id: int, user_id: int) -> bool:
+        """Снимает мут. Возвращает True, если мут был установлен"""
+        state = self.get(chat_id, user_id)
+        if state is None or not state.muted_until:
+            return False
+        state.muted_until = 0.0
+        return True
+
+    def add_warning(self, chat_id: int, user_id: int) -> int:
+        state = self._get_or_create(chat_id, user_id, time.monotonic())
+        state.warnings += 1
+        return state.warnings
+
+    def reset_warnings(self, chat_id: int, user_id: int) -> None:
+        state = self.get(chat_id, user_id)
+        if state is not None:
+            state.warnings = 0
+
+    def register_message(self, chat_id: int, user_id: int) -> int:
+        """Добавляет сообщение в окно флуда и возвращает число сообщений в окне"""
+        now = time.monotonic()
+        state = self._get_or_create(chat_id, user_id, now)
+        flood = state.flood
+        if flood is None:
+            flood = state.flood = array('d')
+        border = now - self.flood_window
+        stale = 0
+        while stale < len(flood) and flood[stale] < border:
+            stale += 1
+        if stale:
+            del flood[:stale]
+        flood.append(now)
+        # Для решения о флуде достаточно SPAM_LIMIT + 1 последних отметок
+        if len(flood) > self.flood_limit + 1:
+            del flood[0]
+        return len(flood)
+
+    def _evict_lru(self, now: float) -> None:
+        """
+        Вытесняет самую давнюю запись без активного мута среди первых
+        EVICTION_SCAN_LIMIT записей, а если таких нет - самую давнюю запись.
+        Просмотр ограничен, чтобы вставка на пути обработки сообщения оставалась O(1)
+        """
+        states = self._states
+        for scanned, (key, state) in enumerate(states.items()):
+            if not state.is_muted(now):
+                del states[key]
+                return
+            if scanned + 1 >= EVICTION_SCAN_LIMIT:
+                break
+        # Все просмотренные записи под мутом: переполнение важнее, мут самой давней снимается досрочно
+        if states:
+            del states[next(iter(states))]
+
+    def cleanup(self) -> int:
+        """Удаляет пустые и давно неактивные записи, возвращает их количество"""
+        now = time.monotonic()
+        to_delete = []
+        for key, state in self._states.items():
+            if state.is_empty(now, self.flood_window):
+                to_delete.append(key)
+            elif not state.is_muted(now) and now - state.last_seen > self.idle_ttl:
+                to_delete.append(key)
+            elif state.flood and now - state.flood[-1] > self.flood_window:
+                state.flood = None
+        for key in to_delete:
+            del self._states[key]
+        return len(to_delete)
+
+    def memory_usage(self, sample_size: int = 1000) -> dict:
+        """Оценка занимаемой памяти по выборке записей"""
+        entries = len(self._states)
+        if not entries:
+            return {'entries': 0, 'bytes': sys.getsizeof(self._states), 'bytes_per_entry': 0}
+
+        sampled = 0
+        sample_bytes = 0
+        for key, state in self._states.items():
+            sample_bytes += sys.getsizeof(key) + sys.getsizeof(state)
+            if state.flood is not None:
+                sample_bytes += sys.getsizeof(state.flood)
+            sampled += 1
+            if sampled >= sample_size:
+                break
+        # Доля самой хеш-таблицы делится поровну между записями
+        table_bytes = sys.getsizeof(self._states)
+        per_entry = sample_bytes / sampled + table_bytes / entries
+        return {
+            'entries': entries,
+            'bytes': int(per_entry * entries),
+            'bytes_per_entry': int(per_entry),
+        }
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+user_states = UserStateStore(
+    flood_window=Config.TIME_UPDATE_COUNT_MESSAGES,
+    flood_limit=Config.SPAM_LIMIT,
+    idle_ttl=getattr(Config, 'USER_STATE_IDLE_TTL', 7 * 86400),
+    max_entries=getattr(Config, 'USER_STATE_MAX_ENTRIES', 1000000)
+)